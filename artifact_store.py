@@ -0,0 +1,73 @@
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+CURRENT_NAME = "CURRENT"
+VERSIONS_DIR = "versions"
+KEEP_VERSIONS = 3
+
+
+def current_version(root: Path) -> Optional[str]:
+    try:
+        name = (Path(root) / CURRENT_NAME).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    return name or None
+
+
+def resolve_artifacts(root: Path) -> Path:
+    """Directory holding the live artifacts under ``root``.
+
+    Published roots point at ``versions/<stamp>`` through the CURRENT file;
+    roots written directly by ``train.py --out`` are returned unchanged.
+    """
+    root = Path(root)
+    version = current_version(root)
+    return root / VERSIONS_DIR / version if version else root
+
+
+def is_published(root: Path) -> bool:
+    return (Path(root) / CURRENT_NAME).exists()
+
+
+def _version_stamp(versions: Path) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    name, n = stamp, 1
+    while (versions / name).exists():
+        n += 1
+        name = f"{stamp}-{n}"
+    return name
+
+
+@contextmanager
+def staging_dir(root: Path, keep: int = KEEP_VERSIONS) -> Iterator[Path]:
+    """Yield an empty directory to write a new version into, then publish it atomically.
+
+    On success the directory is renamed to ``versions/<stamp>`` and CURRENT is
+    replaced to point at it, so readers see either the old or the new version,
+    never a partial one. Older versions beyond ``keep`` are removed; processes
+    that still have their files mapped keep working on POSIX systems.
+    """
+    root = Path(root)
+    versions = root / VERSIONS_DIR
+    versions.mkdir(parents=True, exist_ok=True)
+    tmp = versions / f".tmp-{os.getpid()}-{time.monotonic_ns()}"
+    tmp.mkdir()
+    try:
+        yield tmp
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    name = _version_stamp(versions)
+    os.rename(tmp, versions / name)
+    pointer = root / f"{CURRENT_NAME}.tmp"
+    pointer.write_text(name + "\n", encoding="utf-8")
+    os.replace(pointer, root / CURRENT_NAME)
+
+    published = sorted(p for p in versions.iterdir() if p.is_dir() and not p.name.startswith("."))
+    for old in published[:-keep] if keep > 0 else []:
+        if old.name != name:
+            shutil.rmtree(old, ignore_errors=True)
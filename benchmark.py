@@ -0,0 +1,196 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from instrumentation import peak_rss_mb
+
+BATCH_SIZES = (1, 32, 1000, 100000)
+# Relative change that counts as a regression in --compare mode.
+DEFAULT_TOLERANCE = 0.25
+
+
+def synthetic_corpus(texts: np.ndarray, y: np.ndarray, n_rows: int, seed: int):
+    # Word-bigram Markov chains per class keep the label balance, message lengths
+    # and a growing vocabulary, unlike resampling the same messages.
+    from synth_corpus import MarkovCorpus
+
+    return MarkovCorpus(texts, y).sample(n_rows, seed)
+
+
+def time_batches(clf, vec, texts: List[str], batch_size: int, min_messages: int) -> dict:
+    batch = [texts[i % len(texts)] for i in range(batch_size)]
+    repeats = max(1, min_messages // batch_size)
+    vec.transform(batch[:32])  # warm-up
+    transform_s = []
+    predict_s = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        X = vec.transform(batch)
+        t1 = time.perf_counter()
+        clf.decision_function(X)
+        t2 = time.perf_counter()
+        transform_s.append(t1 - t0)
+        predict_s.append(t2 - t1)
+    total = np.asarray(transform_s) + np.asarray(predict_s)
+    return {
+        "batch_size": batch_size,
+        "repeats": repeats,
+        "vectorize_ms": float(np.median(transform_s) * 1000),
+        "decision_ms": float(np.median(predict_s) * 1000),
+        "latency_ms_p50": float(np.percentile(total, 50) * 1000),
+        "latency_ms_p99": float(np.percentile(total, 99) * 1000),
+        "throughput_msgs_per_s": float(batch_size / np.median(total)),
+    }
+
+
+def run_corpus(data_path: str, artifacts: Optional[str], scale: float, seed: int,
+               batch_sizes: List[int], min_messages: int) -> dict:
+    # Runs in its own process so peak RSS belongs to this corpus alone.
+    from sklearn.model_selection import train_test_split
+
+    from count_cache import analyzer_params, fit_from_counts, load_counts
+    from dataset_cache import load_dataset
+    from model_bundle import load_model
+    from train import build_classifier, build_vectorizer
+
+    t0 = time.perf_counter()
+    texts, y, _ = load_dataset(Path(data_path))
+    load_s = time.perf_counter() - t0
+    name = "sms"
+    if scale != 1:
+        texts, y = synthetic_corpus(texts, y, int(len(texts) * scale), seed)
+        name = f"synthetic_x{scale:g}"
+
+    idx_train, idx_test = train_test_split(np.arange(len(texts)), test_size=0.2, random_state=seed, stratify=y)
+    X_test, y_train = texts[idx_test], y[idx_train]
+    # Same path as train.py: count the whole corpus once (cold, no count cache),
+    # then select the vocabulary and fit TF-IDF from the training rows' counts.
+    vectorizer = build_vectorizer()
+    t0 = time.perf_counter()
+    counts, feature_names, _ = load_counts(None, texts, analyzer_params(vectorizer))
+    count_s = time.perf_counter() - t0
+    train_counts = counts[idx_train]
+    cols, tfidf = fit_from_counts(vectorizer, train_counts, feature_names)
+    X_train_vec = tfidf.transform(train_counts[:, cols].astype(vectorizer.dtype))
+    vec_fit_s = time.perf_counter() - t0
+    clf = build_classifier(seed)
+    t0 = time.perf_counter()
+    clf.fit(X_train_vec, y_train)
+    clf_fit_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    vectorizer.transform(X_test)
+    vec_transform_s = time.perf_counter() - t0
+
+    # Latency is measured on the shipped artifacts when they exist, since that
+    # is the path the app and scoring tools load.
+    source = "trained"
+    if artifacts and Path(artifacts).exists():
+        clf, vectorizer = load_model(Path(artifacts))
+        source = str(artifacts)
+    sample = list(X_test)
+    batches = [time_batches(clf, vectorizer, sample, b, min_messages) for b in batch_sizes]
+
+    return {
+        "corpus": name,
+        "rows": int(len(texts)),
+        "dataset_load_s": load_s,
+        "count_matrix_s": count_s,
+        "vectorizer_fit_s": vec_fit_s,
+        "classifier_fit_s": clf_fit_s,
+        "train_time_s": vec_fit_s + clf_fit_s,
+        "vectorize_time_s": vec_transform_s,
+        "vectorize_msgs_per_s": len(X_test) / max(vec_transform_s, 1e-12),
+        "predict_model": source,
+        "batches": batches,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def flatten(results: dict) -> dict:
+    flat = {}
+    for corpus in results["corpora"]:
+        prefix = corpus["corpus"]
+        for key, value in corpus.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and key != "rows":
+                flat[f"{prefix}.{key}"] = value
+        for b in corpus["batches"]:
+            for key in ("latency_ms_p50", "throughput_msgs_per_s"):
+                flat[f"{prefix}.batch{b['batch_size']}.{key}"] = b[key]
+    return flat
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    cur, base = flatten(current), flatten(baseline)
+    for key, old in base.items():
+        new = cur.get(key)
+        if new is None or not old:
+            continue
+        higher_is_better = key.endswith("_per_s")
+        change = (old - new) / old if higher_is_better else (new - old) / old
+        if change > tolerance:
+            regressions.append(f"{key}: {old:.4g} -> {new:.4g} ({change:+.0%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training and inference benchmarks with regression checks")
+    parser.add_argument("--data", type=str, default="dataset/sms_spam_no_header.csv", help="Bundled SMS CSV")
+    parser.add_argument("--artifacts", type=str, default="artifacts", help="Artifacts used for latency measurements")
+    parser.add_argument("--scales", type=str, default="1,4,16",
+                        help="Comma-separated corpus sizes as multiples of the dataset (1 = the dataset itself)")
+    parser.add_argument("--batch-sizes", type=str, default=",".join(map(str, BATCH_SIZES)))
+    parser.add_argument("--min-messages", type=int, default=20000, help="Messages timed per batch size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default="bench_results.json", help="Where to write results")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative slowdown allowed before a metric is flagged")
+    args = parser.parse_args()
+
+    scales = [float(s) for s in args.scales.split(",")]
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    corpora = []
+    for scale in scales:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            res = pool.submit(run_corpus, args.data, args.artifacts, scale, args.seed,
+                              batch_sizes, args.min_messages).result()
+        corpora.append(res)
+        print(f"[{res['corpus']}] rows={res['rows']} train={res['train_time_s']:.2f}s "
+              f"vectorize={res['vectorize_msgs_per_s']:,.0f} msg/s peak_rss={res['peak_rss_mb'] or 0:.0f} MB")
+        for b in res["batches"]:
+            print(f"    batch={b['batch_size']:>6} p50={b['latency_ms_p50']:.3f} ms "
+                  f"p99={b['latency_ms_p99']:.3f} ms throughput={b['throughput_msgs_per_s']:,.0f} msg/s")
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpora": corpora,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark results written to: {Path(args.output).resolve()}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"=== {len(regressions)} regression(s) vs {args.compare} (tolerance {args.tolerance:.0%}) ===")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions vs {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+CASCADE_NAME = "cascade.npz"
+DEFAULT_BAND = 0.5
+DEFAULT_FEATURES = 1 << 18
+# Odd 32-bit multiplier for multiply-shift hashing of trigram ids.
+_HASH_MUL = np.uint32(2654435761)
+
+
+def trigram_hashes(texts: List[str], n_features: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Hash every lowercased UTF-8 byte trigram of ``texts`` in one pass over the joined bytes.
+
+    Returns (bucket per trigram position, valid mask, per-message byte offsets);
+    positions whose trigram straddles two messages are masked out.
+    """
+    encoded = [t.lower().encode("utf-8") for t in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    b = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint32)
+    if len(b) < 3:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool), offsets
+    ids = (b[:-2] << np.uint32(16)) | (b[1:-1] << np.uint32(8)) | b[2:]
+    shift = np.uint32(32 - int(n_features).bit_length() + 1)
+    buckets = ((ids * _HASH_MUL) >> shift).astype(np.int64)
+    valid = np.ones(len(ids), dtype=bool)
+    ends = offsets[1:-1]
+    for back in (1, 2):
+        pos = ends - back
+        valid[pos[(pos >= 0) & (pos < len(ids))]] = False
+    return buckets, valid, offsets
+
+
+class Prefilter:
+    """Cheap first cascade stage: a linear model on hashed character trigrams.
+
+    Features are trigram counts scaled by 1/sqrt(#trigrams), computed with numpy
+    over the raw bytes of a whole chunk, so scoring skips regex tokenization,
+    n-gram generation and vocabulary lookups entirely. Messages whose margin is
+    within ``band`` of zero are left to the full model.
+    """
+
+    def __init__(self, coef: np.ndarray, intercept: float, band: float = DEFAULT_BAND):
+        self.coef = np.asarray(coef, dtype=np.float32)
+        self.intercept = float(intercept)
+        self.band = band
+
+    @property
+    def n_features(self) -> int:
+        return len(self.coef)
+
+    @staticmethod
+    def features(texts: List[str], n_features: int) -> sp.csr_matrix:
+        buckets, valid, offsets = trigram_hashes(texts, n_features)
+        counts = np.maximum(np.diff(offsets) - 2, 0)
+        rows = np.repeat(np.arange(len(texts)), counts)
+        scale = 1.0 / np.sqrt(np.maximum(counts, 1))
+        X = sp.csr_matrix((scale[rows], (rows, buckets[valid])), shape=(len(texts), n_features))
+        X.sum_duplicates()
+        return X
+
+    @classmethod
+    def fit(cls, texts: List[str], y: np.ndarray, n_features: int = DEFAULT_FEATURES,
+            band: float = DEFAULT_BAND, seed: int = 42) -> "Prefilter":
+        from sklearn.svm import LinearSVC
+
+        if n_features & (n_features - 1):
+            raise ValueError(f"n_features must be a power of two, got {n_features}")
+        clf = LinearSVC(random_state=seed)
+        clf.fit(cls.features(texts, n_features), y)
+        return cls(clf.coef_.ravel(), clf.intercept_[0], band)
+
+    def decision_function(self, texts: List[str]) -> np.ndarray:
+        buckets, valid, offsets = trigram_hashes(texts, self.n_features)
+        weights = np.where(valid, self.coef[buckets], 0.0)
+        cum = np.concatenate([[0.0], np.cumsum(weights, dtype=np.float64)])
+        counts = np.maximum(np.diff(offsets) - 2, 0)
+        starts = np.minimum(offsets[:-1], len(weights))
+        sums = cum[starts + counts] - cum[starts]
+        return sums / np.sqrt(np.maximum(counts, 1)) + self.intercept
+
+    def uncertain(self, margins: np.ndarray) -> np.ndarray:
+        return np.abs(margins) < self.band
+
+    def save(self, path: Path) -> None:
+        np.savez(path, coef=self.coef, intercept=np.float64(self.intercept), band=np.float64(self.band))
+
+    @classmethod
+    def load(cls, path: Path) -> "Prefilter":
+        with np.load(path) as data:
+            return cls(data["coef"], float(data["intercept"]), float(data["band"]))
+
+
+def load_prefilter(art_dir: Path, band: Optional[float] = None) -> Optional[Prefilter]:
+    path = Path(art_dir) / CASCADE_NAME
+    if not path.exists():
+        return None
+    prefilter = Prefilter.load(path)
+    if band is not None:
+        prefilter.band = band
+    return prefilter
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+import sklearn
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+
+from dataset_cache import cache_dir_for
+from preprocess import ngram_orders, select_vocabulary
+
+# Vectorizer settings that change which tokens and n-grams are counted. Vocabulary
+# pruning (min_df, max_features) is applied later, so it is not part of the key.
+ANALYZER_PARAMS = ("lowercase", "strip_accents", "analyzer", "token_pattern", "ngram_range", "stop_words")
+
+
+def analyzer_params(vectorizer) -> dict:
+    params = vectorizer.get_params()
+    return {name: params[name] for name in ANALYZER_PARAMS}
+
+
+def texts_digest(texts) -> str:
+    h = hashlib.sha256()
+    for t in texts:
+        h.update(t.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def counts_key(digest: str, params: dict) -> str:
+    # The tokenizer lives in sklearn, so its version is part of the analyzer settings.
+    settings = json.dumps({**params, "sklearn": sklearn.__version__}, sort_keys=True, default=list)
+    return f"{digest[:16]}-{hashlib.sha256(settings.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _save(path: Path, counts: sp.csr_matrix, feature_names: np.ndarray) -> None:
+    encoded = [name.encode("utf-8") for name in feature_names]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, data=counts.data, indices=counts.indices, indptr=counts.indptr,
+                 shape=np.array(counts.shape, dtype=np.int64),
+                 name_blob=np.frombuffer(b"".join(encoded), dtype=np.uint8), name_offsets=offsets)
+    os.replace(tmp, path)
+
+
+def _load(path: Path) -> Tuple[sp.csr_matrix, np.ndarray]:
+    with np.load(path) as f:
+        counts = sp.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+        blob = f["name_blob"].tobytes()
+        offsets = f["name_offsets"]
+    names = np.array([blob[a:b].decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])], dtype=object)
+    return counts, names
+
+
+def load_counts(data_path: Optional[Path], texts, params: dict) -> Tuple[sp.csr_matrix, np.ndarray, bool]:
+    """Return (count matrix, feature names, cache hit) for ``texts`` under the analyzer ``params``.
+
+    The matrix counts every n-gram in ``params["ngram_range"]`` with no pruning and
+    is stored next to ``data_path`` keyed by a hash of the texts plus the analyzer
+    settings. Pass ``data_path=None`` to tokenize without caching.
+    """
+    path = None
+    if data_path is not None:
+        cache_dir = cache_dir_for(Path(data_path))
+        digest = texts_digest(texts)
+        path = cache_dir / f"counts-{counts_key(digest, params)}.npz"
+        if path.exists():
+            try:
+                counts, names = _load(path)
+                return counts, names, True
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Count cache unreadable ({e}); re-tokenizing")
+
+    counter = CountVectorizer(**params, dtype=np.int32)
+    counts = counter.fit_transform(texts).tocsr()
+    names = counter.get_feature_names_out().astype(object)
+    if path is not None:
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            # Matrices for an earlier version of the data can never be hit again.
+            for old in cache_dir.glob("counts-*.npz"):
+                if not old.name.startswith(f"counts-{digest[:16]}-"):
+                    old.unlink(missing_ok=True)
+            _save(path, counts, names)
+        except OSError as e:
+            print(f"Count cache not written ({e})")
+    return counts, names, False
+
+
+def fit_from_counts(vectorizer, counts: sp.csr_matrix, feature_names: np.ndarray) -> Tuple[np.ndarray, TfidfTransformer]:
+    """Fit ``vectorizer`` on the documents behind ``counts`` without tokenizing them again.
+
+    Applies the vectorizer's n-gram range, ``min_df`` and ``max_features`` to the
+    cached counts, then sets ``vocabulary_`` and ``idf_`` as ``fit`` would. Returns
+    the selected count columns and the fitted transformer that maps
+    ``counts[:, columns].astype(vectorizer.dtype)`` to TF-IDF.
+    """
+    params = vectorizer.get_params()
+    min_df = params["min_df"]
+    if isinstance(min_df, float):
+        min_df = min_df * counts.shape[0]
+    cols = select_vocabulary(counts, ngram_orders(feature_names), params["ngram_range"], min_df,
+                             params["max_features"])
+    tfidf = TfidfTransformer(norm=params["norm"], use_idf=params["use_idf"], smooth_idf=params["smooth_idf"],
+                             sublinear_tf=params["sublinear_tf"])
+    # Fitting on counts in the vectorizer's dtype keeps idf_ (and every transform) in it.
+    tfidf.fit(counts[:, cols].astype(vectorizer.dtype))
+    vectorizer.vocabulary_ = {feature_names[c]: i for i, c in enumerate(cols)}
+    vectorizer.idf_ = tfidf.idf_
+    return cols, tfidf
@@ -0,0 +1,168 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from preprocess import clean_dataset, map_labels, read_dataset
+
+CACHE_FORMAT = 1
+HASH_BLOCK = 1 << 20
+
+
+def cache_dir_for(path: Path) -> Path:
+    return path.with_name(path.name + ".cache")
+
+
+def hash_prefix(path: Path, size: int) -> "hashlib._Hash":
+    h = hashlib.sha256()
+    remaining = size
+    with open(path, "rb") as f:
+        while remaining > 0:
+            block = f.read(min(HASH_BLOCK, remaining))
+            if not block:
+                break
+            h.update(block)
+            remaining -= len(block)
+    return h
+
+
+def _read_manifest(cache_dir: Path) -> Optional[dict]:
+    try:
+        manifest = json.loads((cache_dir / "manifest.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("format") == CACHE_FORMAT else None
+
+
+def _write_manifest(cache_dir: Path, manifest: dict) -> None:
+    tmp = cache_dir / "manifest.json.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, cache_dir / "manifest.json")
+
+
+def _write_part(cache_dir: Path, index: int, texts, y: np.ndarray) -> dict:
+    # Columnar layout: labels as int8, texts as one UTF-8 blob plus byte offsets.
+    encoded = [t.encode("utf-8") for t in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    name = f"part-{index:05d}.npz"
+    np.savez(cache_dir / name, y=np.asarray(y, dtype=np.int8),
+             text_blob=np.frombuffer(b"".join(encoded), dtype=np.uint8), text_offsets=offsets)
+    return {"file": name, "rows": len(encoded)}
+
+
+def _read_part(cache_dir: Path, name: str) -> Tuple[List[str], np.ndarray]:
+    with np.load(cache_dir / name) as part:
+        blob = part["text_blob"].tobytes()
+        offsets = part["text_offsets"]
+        y = part["y"]
+    texts = [blob[a:b].decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])]
+    return texts, y
+
+
+def _add_part(cache_dir: Path, manifest: dict, labels, texts) -> None:
+    label_map = manifest["label_map"]
+    y = pd.Series(labels).astype(str).str.strip().str.lower().map(label_map)
+    if y.isna().any():
+        raise ValueError(f"Labels outside the cached label map {label_map}")
+    manifest["parts"].append(_write_part(cache_dir, len(manifest["parts"]), list(texts), y.values))
+    manifest["rows"] += len(y)
+
+
+def append_rows(path: Path, labels, texts) -> None:
+    """Append already-cleaned rows to the cache of ``path`` as a new part file."""
+    cache_dir = cache_dir_for(Path(path))
+    manifest = _read_manifest(cache_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No dataset cache for {path}")
+    _add_part(cache_dir, manifest, labels, texts)
+    _write_manifest(cache_dir, manifest)
+
+
+def _rebuild(path: Path, cache_dir: Path, size: int, digest: str) -> None:
+    df = read_dataset(path)
+    y, label_map = map_labels(df["label"])
+    if pd.isna(y).any():
+        raise ValueError("labels outside the binary label map cannot be cached")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    cache_dir.mkdir(parents=True)
+    part = _write_part(cache_dir, 0, df["text"].tolist(), y)
+    _write_manifest(cache_dir, {
+        "format": CACHE_FORMAT,
+        "source": path.name,
+        "source_size": size,
+        "source_sha256": digest,
+        "label_map": label_map,
+        "rows": part["rows"],
+        "parts": [part],
+    })
+
+
+def _append_tail(path: Path, cache_dir: Path, manifest: dict, size: int, digest: str) -> bool:
+    # New rows appended to the source CSV: parse only the bytes past the cached prefix.
+    with open(path, "rb") as f:
+        if manifest["source_size"] > 0:
+            f.seek(manifest["source_size"] - 1)
+            if f.read(1) != b"\n":
+                return False
+        tail = f.read(size - manifest["source_size"])
+    try:
+        df = pd.read_csv(io.BytesIO(tail), header=None, names=["label", "text"], encoding="utf-8")
+    except Exception:
+        return False
+    df = clean_dataset(df)
+    try:
+        if len(df):
+            _add_part(cache_dir, manifest, df["label"], df["text"].tolist())
+    except ValueError:
+        return False
+    # Parts and the new source fingerprint land in one manifest write.
+    manifest.update(source_size=size, source_sha256=digest)
+    _write_manifest(cache_dir, manifest)
+    return True
+
+
+def load_dataset(path: Path, use_cache: bool = True) -> Tuple[np.ndarray, np.ndarray, dict]:
+    """Return (texts, y, label_map) for ``path``, served from the columnar cache when possible."""
+    path = Path(path)
+    if not use_cache:
+        df = read_dataset(path)
+        y, label_map = map_labels(df["label"])
+        return df["text"].to_numpy(dtype=object), y, label_map
+
+    cache_dir = cache_dir_for(path)
+    size = path.stat().st_size
+    manifest = _read_manifest(cache_dir)
+    fresh = False
+    if manifest is not None and size >= manifest["source_size"]:
+        h = hash_prefix(path, manifest["source_size"])
+        if h.hexdigest() == manifest["source_sha256"]:
+            if size == manifest["source_size"]:
+                fresh = True
+            else:
+                with open(path, "rb") as f:
+                    f.seek(manifest["source_size"])
+                    for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                        h.update(block)
+                fresh = _append_tail(path, cache_dir, manifest, size, h.hexdigest())
+    if not fresh:
+        try:
+            _rebuild(path, cache_dir, size, hash_prefix(path, size).hexdigest())
+        except (OSError, ValueError) as e:
+            print(f"Dataset cache unavailable ({e}); reading {path} directly")
+            return load_dataset(path, use_cache=False)
+
+    manifest = _read_manifest(cache_dir)
+    texts: List[str] = []
+    ys = []
+    for part in manifest["parts"]:
+        part_texts, part_y = _read_part(cache_dir, part["file"])
+        texts.extend(part_texts)
+        ys.append(part_y)
+    return np.asarray(texts, dtype=object), np.concatenate(ys).astype(np.int64), manifest["label_map"]
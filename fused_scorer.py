@@ -0,0 +1,130 @@
+import argparse
+import math
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from artifact_store import resolve_artifacts
+from model_bundle import load_model
+
+FUSED_NAME = "fused_scorer.joblib"
+ANALYZER_PARAMS = (
+    "lowercase", "analyzer", "ngram_range", "stop_words", "token_pattern",
+    "strip_accents", "preprocessor", "tokenizer", "encoding", "decode_error",
+)
+
+
+class FusedScorer:
+    """Single-message scorer using a term -> (idf, idf * coef) lookup.
+
+    Equivalent to ``clf.decision_function(vec.transform([text]))`` for a fitted
+    TfidfVectorizer + linear classifier, without building a sparse row.
+    """
+
+    def __init__(self, weights: Dict[str, Tuple[float, float]], intercept: float, params: dict):
+        self.weights = weights
+        self.intercept = intercept
+        self.params = params
+        self.norm = params.get("norm", "l2")
+        self.sublinear_tf = params.get("sublinear_tf", False)
+        self.analyzer = TfidfVectorizer(**{k: params[k] for k in ANALYZER_PARAMS if k in params}).build_analyzer()
+
+    @classmethod
+    def from_pipeline(cls, vectorizer, clf) -> "FusedScorer":
+        if not getattr(vectorizer, "use_idf", False) or vectorizer.norm not in ("l2", None):
+            raise ValueError("FusedScorer requires a TfidfVectorizer with use_idf=True and norm in ('l2', None)")
+        coef = np.asarray(clf.coef_).ravel()
+        idf = vectorizer.idf_
+        weights = {
+            term: (float(idf[idx]), float(idf[idx] * coef[idx]))
+            for term, idx in vectorizer.vocabulary_.items()
+        }
+        params = {k: v for k, v in vectorizer.get_params().items() if k in ANALYZER_PARAMS}
+        params["norm"] = vectorizer.norm
+        params["sublinear_tf"] = vectorizer.sublinear_tf
+        return cls(weights, float(np.ravel(clf.intercept_)[0]), params)
+
+    def margin(self, text: str) -> float:
+        dot = 0.0
+        sq = 0.0
+        weights = self.weights
+        for term, count in Counter(self.analyzer(text)).items():
+            entry = weights.get(term)
+            if entry is None:
+                continue
+            tf = 1.0 + math.log(count) if self.sublinear_tf else float(count)
+            dot += tf * entry[1]
+            sq += (tf * entry[0]) ** 2
+        if self.norm == "l2" and sq > 0.0:
+            dot /= math.sqrt(sq)
+        return dot + self.intercept
+
+    def predict_one(self, text: str) -> Tuple[int, float]:
+        m = self.margin(text)
+        return int(m > 0), m
+
+    def save(self, path: Path) -> None:
+        joblib.dump({"weights": self.weights, "intercept": self.intercept, "params": self.params}, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "FusedScorer":
+        state = joblib.load(path)
+        return cls(state["weights"], state["intercept"], state["params"])
+
+
+def export_fused(vectorizer, clf, out_path: Path) -> FusedScorer:
+    scorer = FusedScorer.from_pipeline(vectorizer, clf)
+    scorer.save(out_path)
+    return scorer
+
+
+def benchmark(clf, vec, scorer: FusedScorer, texts: List[str]) -> dict:
+    t0 = time.perf_counter()
+    base = [float(clf.decision_function(vec.transform([t]))[0]) for t in texts]
+    t_pipeline = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fused = [scorer.margin(t) for t in texts]
+    t_fused = time.perf_counter() - t0
+
+    diff = np.abs(np.asarray(base) - np.asarray(fused))
+    return {
+        "messages": len(texts),
+        "pipeline_us_per_msg": t_pipeline / len(texts) * 1e6,
+        "fused_us_per_msg": t_fused / len(texts) * 1e6,
+        "speedup": t_pipeline / max(t_fused, 1e-12),
+        "max_abs_margin_diff": float(diff.max()),
+        "label_mismatches": int(np.sum((np.asarray(base) > 0) != (np.asarray(fused) > 0))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fused scorer against the TF-IDF + LinearSVC pipeline")
+    parser.add_argument("--artifacts", type=str, default="artifacts", help="Directory with model/vectorizer/fused_scorer artifacts")
+    parser.add_argument("--data", type=str, default="dataset/sms_spam_no_header.csv", help="CSV with messages to score")
+    parser.add_argument("--n", type=int, default=2000, help="Number of messages to time")
+    args = parser.parse_args()
+
+    from preprocess import read_dataset
+
+    art = resolve_artifacts(Path(args.artifacts))
+    clf, vec = load_model(art)
+    fused_path = art / FUSED_NAME
+    scorer = FusedScorer.load(fused_path) if fused_path.exists() else FusedScorer.from_pipeline(vec, clf)
+
+    texts = read_dataset(Path(args.data))["text"].tolist()[: args.n]
+    res = benchmark(clf, vec, scorer, texts)
+    print("=== Fused scorer benchmark ===")
+    print(f"Messages: {res['messages']}")
+    print(f"Pipeline: {res['pipeline_us_per_msg']:.1f} us/msg | Fused: {res['fused_us_per_msg']:.1f} us/msg "
+          f"| Speedup: {res['speedup']:.1f}x")
+    print(f"Max |margin diff|: {res['max_abs_margin_diff']:.2e} | Label mismatches: {res['label_mismatches']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+
+TRACE_ENV = "SPAM_TRACE_FILE"
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb() -> Optional[float]:
+    # Resident set size right now; peak_rss_mb() is the high-water mark and never drops.
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):  # not Linux
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class RssSampler:
+    """Tracks the largest current RSS seen while each open stage runs.
+
+    A daemon thread polls every ``interval_s`` and the stage boundaries are
+    sampled too, so a stage's peak is exact at its ends and can miss spikes
+    shorter than the interval in between. RSS is per process: stages running
+    concurrently on other threads count towards each other's peaks.
+    """
+
+    def __init__(self, interval_s: float = 0.01):
+        self.interval_s = interval_s
+        self._open = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self) -> Tuple[object, Optional[float]]:
+        rss = current_rss_mb()
+        token = object()
+        with self._lock:
+            self._open[token] = rss
+            if self._thread is None and rss is not None:
+                self._thread = threading.Thread(target=self._poll, name="rss-sampler", daemon=True)
+                self._thread.start()
+        return token, rss
+
+    def end(self, token) -> Optional[float]:
+        rss = current_rss_mb()
+        with self._lock:
+            peak = self._open.pop(token)
+        return max(peak, rss) if peak is not None and rss is not None else None
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(self.interval_s)
+            with self._lock:
+                if not self._open:
+                    continue
+            rss = current_rss_mb()
+            with self._lock:
+                for token, peak in self._open.items():
+                    self._open[token] = max(peak, rss)
+
+
+class TraceWriter:
+    """Append spans to a Chrome trace-event file (open in chrome://tracing or Perfetto).
+
+    The JSON array is left unterminated, which the trace-event format allows,
+    so spans can be appended by several runs without rewriting the file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def write(self, span: dict) -> None:
+        event = {
+            "name": span["name"],
+            "ph": "X",
+            "ts": span["start"] * 1e6,
+            "dur": span["wall_s"] * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {k: v for k, v in span.items() if k not in ("name", "start", "wall_s")},
+        }
+        with self._lock:
+            new = not self.path.exists() or self.path.stat().st_size == 0
+            with open(self.path, "a", encoding="utf-8") as f:
+                if new:
+                    f.write("[\n")
+                f.write(json.dumps(event) + ",\n")
+
+
+class StageTimer:
+    """Records wall time, CPU time and peak memory for named stages.
+
+    ``mem_peak_mb`` is the most the process RSS rose above its level at the start
+    of the stage (see RssSampler); ``track_memory=False`` skips the sampling.
+    Safe to share between threads: readers go through ``snapshot()``, which
+    copies the spans under the same lock the writers append with.
+    """
+
+    def __init__(self, trace_file: Optional[str] = None, max_spans: Optional[int] = None,
+                 track_memory: bool = True):
+        trace_file = trace_file or os.environ.get(TRACE_ENV)
+        self.trace = TraceWriter(Path(trace_file)) if trace_file else None
+        self.spans = deque(maxlen=max_spans)
+        self.sampler = RssSampler() if track_memory else None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, **attrs):
+        start = time.time()
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        token, rss0 = self.sampler.begin() if self.sampler is not None else (None, None)
+        try:
+            yield
+        finally:
+            rss_peak = self.sampler.end(token) if self.sampler is not None else None
+            span = {
+                "name": name,
+                "start": start,
+                "wall_s": time.perf_counter() - wall0,
+                "cpu_s": time.process_time() - cpu0,
+                "mem_peak_mb": (rss_peak - rss0) if rss_peak is not None else None,
+                "rss_start_mb": rss0,
+                "rss_peak_mb": rss_peak,
+                **attrs,
+            }
+            with self._lock:
+                self.spans.append(span)
+            if self.trace is not None:
+                self.trace.write(span)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return list(self.spans)
+
+    def last(self, name: str) -> Optional[dict]:
+        for span in reversed(self.snapshot()):
+            if span["name"] == name:
+                return span
+        return None
+
+    def summary(self) -> dict:
+        out = {}
+        for span in self.snapshot():
+            entry = out.setdefault(span["name"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "mem_peak_mb": None})
+            entry["count"] += 1
+            entry["wall_s"] += span["wall_s"]
+            entry["cpu_s"] += span["cpu_s"]
+            if span["mem_peak_mb"] is not None:
+                entry["mem_peak_mb"] = max(entry["mem_peak_mb"] or 0.0, span["mem_peak_mb"])
+        return out
+
+    def print_table(self) -> None:
+        print("=== Stage timings ===")
+        for name, s in self.summary().items():
+            mem = f"{s['mem_peak_mb']:+.1f} MB" if s["mem_peak_mb"] is not None else "n/a"
+            print(f"{name:<22} wall={s['wall_s']:8.3f}s cpu={s['cpu_s']:8.3f}s mem_peak={mem}")
+
+
+def best_time(fn, repeats: int = 3) -> float:
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
@@ -0,0 +1,324 @@
+import json
+import os
+import re
+import struct
+import unicodedata
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from artifact_store import resolve_artifacts
+
+MAGIC = b"SPAMBNDL"
+# Version 2 adds optional per-array "scale" for int8-quantized arrays; version 3
+# adds "coef_index" for bundles that store only the unpruned coefficients.
+FORMAT_VERSION = 3
+SUPPORTED_VERSIONS = (1, 2, 3)
+ALIGN = 64
+BUNDLE_NAME = "model.bundle"
+COMPACT_BUNDLE_NAME = "model_compact.bundle"
+QUANTIZE_MODES = ("float16", "int8")
+
+TFIDF_PARAMS = (
+    "lowercase", "analyzer", "ngram_range", "stop_words", "token_pattern", "strip_accents",
+    "encoding", "decode_error", "binary", "norm", "use_idf", "smooth_idf", "sublinear_tf",
+)
+HASHING_PARAMS = (
+    "lowercase", "analyzer", "ngram_range", "stop_words", "token_pattern", "strip_accents",
+    "encoding", "decode_error", "binary", "norm", "n_features", "alternate_sign",
+)
+
+
+def _vectorizer_spec(vectorizer) -> Tuple[str, dict]:
+    kind = "tfidf" if hasattr(vectorizer, "vocabulary_") else "hashing"
+    names = TFIDF_PARAMS if kind == "tfidf" else HASHING_PARAMS
+    params = vectorizer.get_params()
+    if params.get("tokenizer") is not None or params.get("preprocessor") is not None or callable(params.get("analyzer")):
+        raise ValueError("Bundles only support vectorizers without custom callables")
+    spec = {k: params[k] for k in names}
+    spec["ngram_range"] = list(spec["ngram_range"])
+    # Store the resolved stop word list so loading never needs sklearn's copy.
+    stop_words = vectorizer.get_stop_words()
+    spec["stop_words"] = sorted(stop_words) if stop_words is not None else None
+    spec["dtype"] = np.dtype(params.get("dtype", np.float64)).name
+    return kind, spec
+
+
+def _quantize(arr: np.ndarray, mode: Optional[str]) -> Tuple[np.ndarray, Optional[float]]:
+    if mode is None:
+        return arr, None
+    if mode == "float16":
+        return arr.astype(np.float16), None
+    if mode == "int8":
+        # Symmetric linear quantization: value ~= q * scale with q in [-127, 127].
+        peak = float(np.abs(arr).max()) if arr.size else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        return np.round(arr / scale).astype(np.int8), scale
+    raise ValueError(f"Unknown quantization mode {mode!r}; expected one of {QUANTIZE_MODES}")
+
+
+def save_bundle(clf, vectorizer, path: Path, keep: Optional[np.ndarray] = None,
+                quantize: Optional[str] = None) -> None:
+    """Write ``clf`` and ``vectorizer`` as a bundle.
+
+    ``keep`` stores only those coefficients (pruning); the others read back as
+    zero. The vocabulary and IDF stay whole, so every message is normalized over
+    all of its terms and pruning only drops the pruned terms' contributions.
+    ``quantize`` stores coef and IDF as float16 or int8 with a scale factor.
+    """
+    kind, params = _vectorizer_spec(vectorizer)
+    coef = np.ascontiguousarray(np.asarray(clf.coef_).ravel())
+    n_features = int(coef.shape[0])
+    arrays = {}
+    scales = {}
+    if keep is not None:
+        arrays["coef_index"] = np.asarray(keep, dtype=np.int32)
+        coef = coef[keep]
+    arrays["coef"], scales["coef"] = _quantize(coef, quantize)
+    if kind == "tfidf":
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        arrays["vocab"] = np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8)
+        if params["use_idf"]:
+            arrays["idf"], scales["idf"] = _quantize(np.asarray(vectorizer.idf_), quantize)
+
+    header = {
+        "vectorizer": {"kind": kind, "params": params},
+        "classifier": {
+            "classes": np.asarray(clf.classes_).tolist(),
+            "intercept": float(np.ravel(clf.intercept_)[0]),
+        },
+        "n_features": n_features,
+        "arrays": {},
+    }
+    # Lay arrays out back to back after the header, each aligned for mmap views.
+    offset = 0
+    for name, arr in arrays.items():
+        header["arrays"][name] = {"offset": offset, "dtype": arr.dtype.str, "shape": list(arr.shape)}
+        if scales.get(name) is not None:
+            header["arrays"][name]["scale"] = scales[name]
+        offset += -(-arr.nbytes // ALIGN) * ALIGN
+    header_bytes = json.dumps(header).encode("utf-8")
+    prefix_len = len(MAGIC) + 8 + len(header_bytes)
+    data_start = -(-prefix_len // ALIGN) * ALIGN
+
+    tmp = Path(str(path) + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<II", FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_start - prefix_len))
+        for name, arr in arrays.items():
+            f.write(arr.tobytes())
+            f.write(b"\0" * (-arr.nbytes % ALIGN))
+    os.replace(tmp, path)
+
+
+def _strip_accents_unicode(s: str) -> str:
+    try:
+        s.encode("ASCII", errors="strict")
+        return s
+    except UnicodeEncodeError:
+        normalized = unicodedata.normalize("NFKD", s)
+        return "".join([c for c in normalized if not unicodedata.combining(c)])
+
+
+def _strip_accents_ascii(s: str) -> str:
+    return unicodedata.normalize("NFKD", s).encode("ASCII", "ignore").decode("ASCII")
+
+
+def build_word_analyzer(params: dict) -> Callable[[str], List[str]]:
+    """Pure-Python copy of sklearn's word analyzer, so inference does not import sklearn."""
+    lowercase = params["lowercase"]
+    accents = {"unicode": _strip_accents_unicode, "ascii": _strip_accents_ascii}.get(params["strip_accents"])
+    findall = re.compile(params["token_pattern"]).findall
+    stop_words = frozenset(params["stop_words"] or ())
+    min_n, max_n = params["ngram_range"]
+
+    def analyze(doc: str) -> List[str]:
+        if lowercase:
+            doc = doc.lower()
+        if accents is not None:
+            doc = accents(doc)
+        tokens = [w for w in findall(doc) if w not in stop_words]
+        if max_n == 1:
+            return tokens
+        grams = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n + 1, len(tokens) + 1)):
+            for i in range(len(tokens) - n + 1):
+                grams.append(" ".join(tokens[i: i + n]))
+        return grams
+
+    return analyze
+
+
+class BundledVectorizer:
+    """Read-only vectorizer over mmap'd bundle arrays; matches the fitted sklearn vectorizer."""
+
+    def __init__(self, kind: str, params: dict, n_features: int, idf=None, vocab_blob=None):
+        self.kind = kind
+        self.params = dict(params, ngram_range=tuple(params["ngram_range"]))
+        self.n_features = n_features
+        self.idf_ = idf
+        self._vocab_blob = vocab_blob
+        self._vocabulary = None
+        self._analyzer = None
+        self._hashing = None
+        self.dtype = np.dtype(self.params["dtype"])
+        self.norm = self.params["norm"]
+        self.use_idf = self.params.get("use_idf", False)
+        self.sublinear_tf = self.params.get("sublinear_tf", False)
+
+    def get_params(self, deep: bool = True) -> dict:
+        return dict(self.params)
+
+    def _sklearn_vectorizer(self):
+        from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+
+        params = dict(self.params, dtype=self.dtype.type)
+        if self.kind == "hashing":
+            return HashingVectorizer(**params)
+        return TfidfVectorizer(**params)
+
+    def build_analyzer(self):
+        if self._analyzer is None:
+            if self.params["analyzer"] == "word":
+                self._analyzer = build_word_analyzer(self.params)
+            else:
+                self._analyzer = self._sklearn_vectorizer().build_analyzer()
+        return self._analyzer
+
+    @property
+    def vocabulary_(self) -> dict:
+        # Built lazily from the sorted term blob on first use. The dict is private to
+        # each process (about 8 MB RSS at 50000 terms); searching the mapped blob
+        # instead was measured 30-40% slower per token, so transform keeps the dict.
+        if self._vocabulary is None:
+            terms = self.get_feature_names_out()
+            self._vocabulary = dict(zip(terms.tolist(), range(len(terms))))
+        return self._vocabulary
+
+    def get_feature_names_out(self, input_features=None) -> np.ndarray:
+        if self._vocab_blob is None:
+            raise AttributeError("Hashed feature spaces have no feature names")
+        blob = self._vocab_blob.tobytes().decode("utf-8")
+        return np.asarray(blob.split("\n") if blob else [], dtype=object)
+
+    def transform(self, raw_documents: Iterable[str]) -> sp.csr_matrix:
+        if self.kind == "hashing":
+            if self._hashing is None:
+                self._hashing = self._sklearn_vectorizer()
+            return self._hashing.transform(raw_documents)
+
+        analyzer = self.build_analyzer()
+        vocab = self.vocabulary_
+        indices = []
+        indptr = [0]
+        for doc in raw_documents:
+            for tok in analyzer(doc):
+                j = vocab.get(tok)
+                if j is not None:
+                    indices.append(j)
+            indptr.append(len(indices))
+        X = sp.csr_matrix(
+            (np.ones(len(indices), dtype=self.dtype), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+            shape=(len(indptr) - 1, self.n_features),
+        )
+        X.sum_duplicates()
+        if self.params["binary"]:
+            X.data.fill(1)
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.use_idf:
+            X.data *= self.idf_[X.indices]
+        if self.norm:
+            rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+            if self.norm == "l2":
+                norms = np.sqrt(np.bincount(rows, weights=X.data * X.data, minlength=X.shape[0]))
+            else:
+                norms = np.bincount(rows, weights=np.abs(X.data), minlength=X.shape[0])
+            norms[norms == 0.0] = 1.0
+            X.data /= norms[rows].astype(self.dtype)
+        return X
+
+
+class BundledClassifier:
+    """Linear decision function over the mmap'd coefficient vector."""
+
+    def __init__(self, coef: np.ndarray, intercept: float, classes):
+        self._coef = coef
+        self.intercept_ = np.array([intercept], dtype=coef.dtype)
+        self.classes_ = np.asarray(classes)
+
+    @property
+    def coef_(self) -> np.ndarray:
+        return self._coef.reshape(1, -1)
+
+    def decision_function(self, X) -> np.ndarray:
+        return np.asarray(X @ self._coef).ravel() + self.intercept_[0]
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+
+def load_bundle(path: Path) -> Tuple[BundledClassifier, BundledVectorizer]:
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(buf[: len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a model bundle")
+    version, header_len = struct.unpack("<II", bytes(buf[len(MAGIC): len(MAGIC) + 8]))
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported bundle format version {version} (expected one of {SUPPORTED_VERSIONS})")
+    start = len(MAGIC) + 8
+    header = json.loads(bytes(buf[start: start + header_len]).decode("utf-8"))
+    data_start = -(-(start + header_len) // ALIGN) * ALIGN
+
+    # Quantized arrays are restored to the feature dtype (float32 or float64).
+    float_dtype = np.dtype(header["vectorizer"]["params"].get("dtype", "float64"))
+    arrays = {}
+    for name, meta in header["arrays"].items():
+        dtype = np.dtype(meta["dtype"])
+        begin = data_start + meta["offset"]
+        count = int(np.prod(meta["shape"]))
+        arr = buf[begin: begin + count * dtype.itemsize].view(dtype).reshape(meta["shape"])
+        if "scale" in meta:
+            arr = arr.astype(float_dtype) * float_dtype.type(meta["scale"])
+        elif dtype == np.float16:
+            arr = arr.astype(float_dtype)
+        arrays[name] = arr
+
+    vec_meta = header["vectorizer"]
+    vec = BundledVectorizer(vec_meta["kind"], vec_meta["params"], header["n_features"],
+                            idf=arrays.get("idf"), vocab_blob=arrays.get("vocab"))
+    coef = arrays["coef"]
+    if "coef_index" in arrays:
+        coef = np.zeros(header["n_features"], dtype=float_dtype)
+        coef[arrays["coef_index"]] = arrays["coef"]
+    cls_meta = header["classifier"]
+    clf = BundledClassifier(coef, cls_meta["intercept"], cls_meta["classes"])
+    return clf, vec
+
+
+def load_model(art_dir: Path):
+    """Return (clf, vec) from ``art_dir``, preferring the bundle over the joblib pair.
+
+    ``art_dir`` may also be a bundle file, e.g. ``artifacts/model_compact.bundle``.
+    Published artifact roots are followed to the version named in their CURRENT file.
+    """
+    art_dir = Path(art_dir)
+    if art_dir.is_file():
+        return load_bundle(art_dir)
+    art_dir = resolve_artifacts(art_dir)
+    bundle = art_dir / BUNDLE_NAME
+    if bundle.exists():
+        try:
+            return load_bundle(bundle)
+        except ValueError:
+            if not (art_dir / "model.joblib").exists():
+                raise
+    import joblib
+
+    clf = joblib.load(art_dir / "model.joblib")
+    vec = joblib.load(art_dir / "vectorizer.joblib")
+    return clf, vec
@@ -0,0 +1,252 @@
+import argparse
+import json
+import re
+import time
+import zlib
+from itertools import chain
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+NEAR_DUP_NAME = "near_dup.npz"
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 64
+DEFAULT_MAX_ENTRIES = 100000
+# Smallest cluster the index answers for: singletons are ordinary messages, not
+# campaigns, and the model scores them faster than a lookup.
+DEFAULT_MIN_COUNT = 2
+# Messages hashed per block; bounds the (shingles x permutations) working array.
+SIGNATURE_BLOCK = 10000
+
+# Tokens carrying a phone number, short code, amount, e-mail address or URL.
+_VARIABLE_RE = re.compile(r"\d|@|www\.|://|\.(?:com|net|org|uk|biz|info)\b")
+_VARIABLE_TOKEN = "<var>"
+_VARIABLE_HASH = zlib.crc32(_VARIABLE_TOKEN.encode("utf-8"))
+
+
+def normalize_message(text: str) -> str:
+    # Templated spam differs by phone number, short code, URL or amount; map those
+    # tokens to one placeholder so every copy of a campaign shingles the same way.
+    search = _VARIABLE_RE.search
+    return " ".join(_VARIABLE_TOKEN if search(w) else w for w in text.lower().split())
+
+
+def word_hashes(text: str) -> List[int]:
+    # Same tokens as normalize_message, hashed without building the string.
+    search = _VARIABLE_RE.search
+    hashes = [_VARIABLE_HASH if search(w) else zlib.crc32(w.encode("utf-8")) for w in text.lower().split()]
+    # Pad so every message has at least one word bigram.
+    return hashes + [0] * (2 - len(hashes)) if len(hashes) < 2 else hashes
+
+
+def choose_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    # LSH collision probability for similarity s is 1 - (1 - s^r)^b. Pick the split
+    # that minimizes the false-positive area below the threshold plus the
+    # false-negative area above it.
+    s = np.linspace(0.0, 1.0, 201)
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        p = 1.0 - (1.0 - s ** rows) ** bands
+        err = np.where(s < threshold, p, 1.0 - p).mean()
+        if best is None or err < best[0]:
+            best = (err, bands, rows)
+    return best[1], best[2]
+
+
+class NearDupIndex:
+    """MinHash/LSH index of message clusters with a stored verdict per cluster.
+
+    Signatures use word-bigram shingles of :func:`normalize_message`; a query
+    matches when any LSH band collides and the estimated Jaccard similarity is
+    at least ``threshold``.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = DEFAULT_NUM_PERM, seed: int = 1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.seed = seed
+        self.bands, self.rows = choose_bands(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+        self._band_mix = rng.integers(1, 1 << 63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self.labels = np.zeros(0, dtype=np.int8)
+        self.margins = np.zeros(0, dtype=np.float32)
+        self.counts = np.zeros(0, dtype=np.int32)
+        # Row of each entry's representative in the texts passed to fit().
+        self.entry_rows = np.zeros(0, dtype=np.int64)
+        self._band_keys = []
+        self._band_ids = []
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def signature(self, texts: List[str]) -> np.ndarray:
+        if len(texts) > SIGNATURE_BLOCK:
+            return np.concatenate([self.signature(texts[i:i + SIGNATURE_BLOCK])
+                                   for i in range(0, len(texts), SIGNATURE_BLOCK)])
+        if len(texts) == 0:
+            return np.zeros((0, self.num_perm), dtype=np.uint32)
+        hashes = [word_hashes(t) for t in texts]
+        lengths = np.fromiter(map(len, hashes), dtype=np.int64, count=len(hashes))
+        words = np.fromiter(chain.from_iterable(hashes), dtype=np.uint64, count=int(lengths.sum()))
+        # Shingles are word bigrams packed into one 64-bit key; drop the pair that
+        # would straddle the end of each message.
+        ends = np.cumsum(lengths)
+        pairs = (words[:-1] << np.uint64(32)) | words[1:]
+        shingles = np.delete(pairs, ends[:-1] - 1)
+        starts = np.concatenate([[0], ends[:-1] - np.arange(1, len(ends))])
+        # Multiply-shift hashing ((a*x + b) mod 2^64) >> 32 for every permutation at
+        # once, then the per-message minimum over each message's run of shingles.
+        permuted = np.multiply.outer(self._a, shingles)
+        permuted += self._b[:, None]
+        permuted >>= np.uint64(32)
+        return np.minimum.reduceat(permuted, starts, axis=1).T.astype(np.uint32)
+
+    def band_keys(self, sigs: np.ndarray) -> np.ndarray:
+        bands = sigs[:, :self.bands * self.rows].astype(np.uint64).reshape(len(sigs), self.bands, self.rows)
+        return (bands * self._band_mix).sum(axis=2)
+
+    def _reindex(self) -> None:
+        keys = self.band_keys(self.signatures)
+        self._band_ids = [np.argsort(keys[:, b], kind="stable") for b in range(self.bands)]
+        self._band_keys = [keys[ids, b] for b, ids in enumerate(self._band_ids)]
+
+    def query_signatures(self, sigs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (best entry id or -1, estimated similarity) per signature."""
+        best = np.full(len(sigs), -1, dtype=np.int64)
+        best_sim = np.zeros(len(sigs), dtype=np.float64)
+        if len(self) == 0 or len(sigs) == 0:
+            return best, best_sim
+        keys = self.band_keys(sigs)
+        for b in range(self.bands):
+            pos = np.searchsorted(self._band_keys[b], keys[:, b])
+            pos = np.minimum(pos, len(self) - 1)
+            hit = self._band_keys[b][pos] == keys[:, b]
+            if not hit.any():
+                continue
+            rows = np.where(hit)[0]
+            cand = self._band_ids[b][pos[rows]]
+            sim = (sigs[rows] == self.signatures[cand]).mean(axis=1)
+            better = sim > best_sim[rows]
+            best[rows[better]] = cand[better]
+            best_sim[rows[better]] = sim[better]
+        best[best_sim < self.threshold] = -1
+        return best, best_sim
+
+    def lookup(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (matched mask, labels, margins); unmatched rows hold zeros."""
+        ids, _ = self.query_signatures(self.signature(texts))
+        matched = ids >= 0
+        labels = np.zeros(len(texts), dtype=np.int8)
+        margins = np.zeros(len(texts), dtype=float)
+        labels[matched] = self.labels[ids[matched]]
+        margins[matched] = self.margins[ids[matched]]
+        return matched, labels, margins
+
+    def cluster(self, sigs: np.ndarray) -> np.ndarray:
+        """Assign every signature the row of the first near-duplicate it belongs to."""
+        keys = self.band_keys(sigs)
+        parent = np.arange(len(sigs))
+        for b in range(self.bands):
+            _, first, inverse = np.unique(keys[:, b], return_index=True, return_inverse=True)
+            rep = first[inverse]
+            ok = (rep < parent) & ((sigs == sigs[rep]).mean(axis=1) >= self.threshold)
+            parent[ok] = rep[ok]
+        # Follow chains so every member points at its cluster's root.
+        while True:
+            nxt = parent[parent]
+            if np.array_equal(nxt, parent):
+                return parent
+            parent = nxt
+
+    def fit(self, texts: List[str], y: np.ndarray, max_entries: int = DEFAULT_MAX_ENTRIES,
+            min_count: int = DEFAULT_MIN_COUNT) -> np.ndarray:
+        """Build the index from labeled messages; returns the cluster root of each row.
+
+        Clusters with at least ``min_count`` members keep their root's signature,
+        their majority label and their size. When there are more such clusters
+        than ``max_entries``, the largest are kept.
+        """
+        sigs = self.signature(texts)
+        roots = self.cluster(sigs)
+        uniq, inverse, counts = np.unique(roots, return_inverse=True, return_counts=True)
+        spam = np.bincount(inverse, weights=np.asarray(y) == 1, minlength=len(uniq))
+        eligible = np.where(counts >= min_count)[0]
+        keep = eligible[np.argsort(-counts[eligible], kind="stable")[:max_entries]]
+        keep.sort()
+        self.entry_rows = uniq[keep]
+        self.signatures = sigs[self.entry_rows]
+        self.labels = (spam[keep] * 2 > counts[keep]).astype(np.int8)
+        # The margin comes from the same vote as the label: the spam share mapped
+        # to [-1, 1], so its sign always agrees with the label.
+        self.margins = (2.0 * spam[keep] / counts[keep] - 1.0).astype(np.float32)
+        self.counts = counts[keep].astype(np.int32)
+        self._reindex()
+        return roots
+
+    def params(self) -> dict:
+        return {"threshold": self.threshold, "num_perm": self.num_perm, "seed": self.seed,
+                "bands": self.bands, "rows": self.rows}
+
+    def save(self, path: Path) -> None:
+        np.savez(path, signatures=self.signatures, labels=self.labels, margins=self.margins,
+                 counts=self.counts, params=np.array(json.dumps(self.params())))
+
+    @classmethod
+    def load(cls, path: Path) -> "NearDupIndex":
+        with np.load(path) as data:
+            params = json.loads(str(data["params"]))
+            index = cls(params["threshold"], params["num_perm"], params["seed"])
+            index.signatures = data["signatures"]
+            index.labels = data["labels"]
+            index.margins = data["margins"]
+            index.counts = data["counts"]
+        index._reindex()
+        return index
+
+
+def load_index(art_dir: Path) -> Optional[NearDupIndex]:
+    path = Path(art_dir) / NEAR_DUP_NAME
+    return NearDupIndex.load(path) if path.exists() else None
+
+
+def dedup_rows(texts, y: np.ndarray, threshold: float, num_perm: int, max_entries: int,
+               min_count: int = DEFAULT_MIN_COUNT) -> Tuple[np.ndarray, NearDupIndex]:
+    """Return a mask keeping one row per (near-duplicate cluster, label) and the fitted index."""
+    index = NearDupIndex(threshold, num_perm)
+    roots = index.fit(list(texts), y, max_entries, min_count)
+    # Conflicting labels inside a cluster are kept so neither class loses evidence.
+    keys = roots.astype(np.int64) * 2 + (np.asarray(y) == 1)
+    _, first = np.unique(keys, return_index=True)
+    keep = np.zeros(len(texts), dtype=bool)
+    keep[first] = True
+    return keep, index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect near-duplicate clusters in a labeled dataset")
+    parser.add_argument("--data", type=str, default="dataset/sms_spam_no_header.csv", help="Labeled CSV (label,text)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Jaccard similarity threshold")
+    parser.add_argument("--num-perm", type=int, default=DEFAULT_NUM_PERM, help="MinHash permutations")
+    parser.add_argument("--top", type=int, default=10, help="Largest clusters to print")
+    args = parser.parse_args()
+
+    from dataset_cache import load_dataset
+
+    texts, y, _ = load_dataset(Path(args.data))
+    t0 = time.perf_counter()
+    keep, index = dedup_rows(texts, y, args.threshold, args.num_perm, DEFAULT_MAX_ENTRIES)
+    elapsed = time.perf_counter() - t0
+    print(f"Rows: {len(texts)} | after dedup: {int(keep.sum())} | clusters: {len(index)} "
+          f"| bands={index.bands} rows={index.rows} | {elapsed:.2f}s")
+    for i in np.argsort(-index.counts, kind="stable")[:args.top]:
+        label = "spam" if index.labels[i] == 1 else "ham"
+        print(f"{index.counts[i]:>5} x [{label}] {texts[index.entry_rows[i]][:80]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from artifact_store import resolve_artifacts
+
+ARTIFACT_FILES = ("model.bundle", "model.joblib", "vectorizer.joblib")
+
+
+def normalize_text(text: str, lowercase: bool = True) -> str:
+    # Collapsing whitespace never changes the tokens the word analyzer emits.
+    text = " ".join(text.split())
+    return text.lower() if lowercase else text
+
+
+def artifact_fingerprint(art_dir: Path) -> tuple:
+    # Resolving CURRENT means publishing a new version changes the fingerprint.
+    live = resolve_artifacts(art_dir)
+    fp = [str(live)]
+    for name in ARTIFACT_FILES:
+        path = live / name
+        if path.exists():
+            st = path.stat()
+            fp.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(fp)
+
+
+class PredictionCache:
+    """Bounded LRU of (label, margin) keyed by a hash of the normalized message.
+
+    When ``art_dir`` is given, the cache clears itself as soon as the model
+    artifacts in that directory change. Callers holding an already loaded model
+    pass the fingerprint it was loaded under to ``score``; results from a model
+    older than the cached one are returned but never stored.
+    """
+
+    def __init__(self, capacity: int = 100000, art_dir: Optional[Path] = None, lowercase: bool = True):
+        self.capacity = capacity
+        self.art_dir = Path(art_dir) if art_dir is not None else None
+        self.lowercase = lowercase
+        self._data: "OrderedDict[bytes, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = artifact_fingerprint(self.art_dir) if self.art_dir is not None else None
+        self._retired = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.margin_dtype = np.dtype(np.float64)
+
+    def key(self, text: str) -> bytes:
+        return hashlib.blake2b(normalize_text(text, self.lowercase).encode("utf-8"), digest_size=16).digest()
+
+    def check_artifacts(self) -> None:
+        if self.art_dir is not None:
+            self._use(artifact_fingerprint(self.art_dir))
+
+    def _use(self, fp: Optional[tuple]) -> bool:
+        """Switch the cache to the model ``fp``; False if ``fp`` was already replaced."""
+        with self._lock:
+            if fp == self._fingerprint:
+                return True
+            if fp in self._retired:
+                return False
+            if self._fingerprint is not None:
+                self._retired.add(self._fingerprint)
+                self._data.clear()
+                self.invalidations += 1
+            self._fingerprint = fp
+            return True
+
+    def get(self, text: str) -> Optional[Tuple[int, float]]:
+        return self._get(self.key(text), self._fingerprint)
+
+    def _get(self, k: bytes, fp: Optional[tuple]) -> Optional[Tuple[int, float]]:
+        with self._lock:
+            value = self._data.get(k) if fp == self._fingerprint else None
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(k)
+            self.hits += 1
+            return value
+
+    def put(self, text: str, label: int, margin: float) -> None:
+        self._put(self.key(text), label, margin, self._fingerprint)
+
+    def _put(self, k: bytes, label: int, margin: float, fp: Optional[tuple]) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            # The model was swapped while this batch was scoring.
+            if fp != self._fingerprint:
+                return
+            self._data[k] = (int(label), float(margin))
+            self._data.move_to_end(k)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def score(self, texts: List[str], score_fn: Callable[[List[str]], Tuple[np.ndarray, np.ndarray]],
+              fingerprint: Optional[tuple] = None):
+        """Serve cached rows and score only the misses with one ``score_fn`` call.
+
+        ``fingerprint`` identifies the model behind ``score_fn`` (see
+        ``artifact_fingerprint``); it defaults to the artifacts on disk now.
+        """
+        if fingerprint is None:
+            if self.art_dir is None:
+                fingerprint = self._fingerprint
+            else:
+                fingerprint = artifact_fingerprint(self.art_dir)
+        if not self._use(fingerprint):
+            return score_fn(texts)
+        labels = np.zeros(len(texts), dtype=np.int8)
+        margins = np.zeros(len(texts), dtype=self.margin_dtype)
+        # Repeats inside the same batch are scored once: key -> row positions.
+        pending = OrderedDict()
+        for i, text in enumerate(texts):
+            k = self.key(text)
+            cached = self._get(k, fingerprint)
+            if cached is None:
+                pending.setdefault(k, []).append(i)
+            else:
+                labels[i], margins[i] = cached
+        if pending:
+            first_rows = [rows[0] for rows in pending.values()]
+            miss_labels, miss_margins = score_fn([texts[i] for i in first_rows])
+            # Keep the model's margin dtype (float32 models stay float32).
+            if miss_margins.dtype != margins.dtype:
+                self.margin_dtype = miss_margins.dtype
+                margins = margins.astype(self.margin_dtype)
+            for (k, rows), label, margin in zip(pending.items(), miss_labels, miss_margins):
+                labels[rows] = label
+                margins[rows] = margin
+                self._put(k, label, margin, fingerprint)
+        return labels, margins
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
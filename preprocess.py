@@ -0,0 +1,75 @@
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def read_dataset(path: Path) -> pd.DataFrame:
+    # Try headerless first
+    try:
+        df = pd.read_csv(path, header=None, names=["label", "text"], encoding="utf-8")
+    except Exception:
+        # Fallback to autodetect
+        df = pd.read_csv(path, encoding="utf-8")
+    # Normalize columns
+    cols = [c.strip().lower() for c in df.columns]
+    df.columns = cols
+    if "label" not in df.columns or "text" not in df.columns:
+        # Try infer if there are exactly two columns
+        if len(df.columns) == 2:
+            df.columns = ["label", "text"]
+        else:
+            raise ValueError(
+                f"Expected columns ['label','text'] in {path}, got: {df.columns.tolist()}"
+            )
+    return clean_dataset(df)
+
+
+def clean_dataset(df: pd.DataFrame) -> pd.DataFrame:
+    # Drop NA and empty
+    df = df.dropna(subset=["label", "text"]).copy()
+    df["text"] = df["text"].astype(str).str.strip()
+    df = df[df["text"].str.len() > 0]
+    return df
+
+
+def map_labels(labels: pd.Series) -> Tuple[np.ndarray, dict]:
+    # Standard dataset uses 'ham' / 'spam'. Handle common variants.
+    label_map = {}
+    l = labels.astype(str).str.strip().str.lower()
+    unique = sorted(l.unique())
+    if set(unique).issubset({"ham", "spam"}):
+        label_map = {"ham": 0, "spam": 1}
+        y = l.map(label_map).values
+    elif set(unique).issubset({"0", "1"}):
+        label_map = {"0": 0, "1": 1}
+        y = l.map(label_map).values
+    else:
+        # Fallback: make the most frequent class 0 and the other 1
+        counts = l.value_counts()
+        classes = list(counts.index[:2])
+        label_map = {classes[0]: 0, classes[1]: 1}
+        y = l.map(label_map).values
+    return y, label_map
+
+
+def ngram_orders(feature_names) -> np.ndarray:
+    return np.fromiter((name.count(" ") + 1 for name in feature_names), dtype=np.int8, count=len(feature_names))
+
+
+def select_vocabulary(counts, orders: np.ndarray, ngram_range: Tuple[int, int],
+                      min_df: int, max_features) -> np.ndarray:
+    # Same rule as CountVectorizer._limit_features, applied to cached counts (including
+    # its default, unstable argsort, so ties at the max_features cutoff break the same way):
+    # n-gram order filter, then min_df, then the max_features most frequent terms.
+    mask = (orders >= ngram_range[0]) & (orders <= ngram_range[1])
+    dfs = np.bincount(counts.indices, minlength=counts.shape[1])
+    mask &= dfs >= min_df
+    if max_features is not None and mask.sum() > max_features:
+        tfs = np.asarray(counts.sum(axis=0)).ravel()
+        kept = np.where(mask)[0]
+        kept = kept[(-tfs[kept]).argsort()[:max_features]]
+        mask = np.zeros_like(mask)
+        mask[kept] = True
+    return np.where(mask)[0]
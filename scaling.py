@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from synth_corpus import MarkovCorpus, parse_rows, write_corpus
+
+TRAIN_SCRIPT = Path(__file__).resolve().parent / "train.py"
+# Cold runs by default: every size pays for read_dataset and tokenization.
+DEFAULT_TRAIN_ARGS = "--no-cache"
+
+
+def _limit_memory(limit_gb: Optional[float]):
+    if not limit_gb:
+        return None
+
+    def preexec():
+        import resource
+
+        limit = int(limit_gb * (1 << 30))
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    return preexec
+
+
+def run_train(csv_path: Path, out_dir: Path, train_args: List[str], timeout: Optional[float],
+              memory_limit_gb: Optional[float], log_path: Path) -> dict:
+    """Run train.py in a child process; return wall time, peak RSS and how it exited."""
+    cmd = [sys.executable, str(TRAIN_SCRIPT), "--data", str(csv_path), "--out", str(out_dir), *train_args]
+    t0 = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, preexec_fn=_limit_memory(memory_limit_gb))
+        timed_out = False
+        if hasattr(os, "wait4"):
+            # wait4 reports the child's own peak RSS, which the parent cannot see otherwise.
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    break
+                if deadline is not None and time.monotonic() > deadline:
+                    proc.kill()
+                    timed_out = True
+                    pid, status, usage = os.wait4(proc.pid, 0)
+                    break
+                time.sleep(0.05)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is KiB on Linux, bytes on macOS.
+            peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        else:
+            try:
+                proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                timed_out = True
+            peak_rss_mb = None
+    wall = time.perf_counter() - t0
+
+    code = proc.returncode
+    if timed_out:
+        failure = f"timeout after {timeout:.0f}s"
+    elif code < 0:
+        # SIGKILL without a timeout is almost always the kernel OOM killer.
+        failure = f"killed by {signal.Signals(-code).name}" + (" (likely OOM)" if -code == signal.SIGKILL else "")
+    elif code != 0:
+        failure = f"exit code {code}"
+    else:
+        failure = None
+    if failure and not timed_out:
+        tail = log_path.read_text(encoding="utf-8", errors="replace").strip().splitlines()[-1:]
+        if tail:
+            failure += f": {tail[0].strip()[:200]}"
+    return {"command": " ".join(shlex.quote(c) for c in cmd), "wall_s": wall, "peak_rss_mb": peak_rss_mb,
+            "exit_code": code, "failure": failure}
+
+
+def describe_artifacts(out_dir: Path) -> dict:
+    from artifact_store import resolve_artifacts
+    from model_bundle import load_model
+
+    live = resolve_artifacts(out_dir)
+    _, vectorizer = load_model(live)
+    metrics_path = live / "metrics.json"
+    metrics = json.loads(metrics_path.read_text(encoding="utf-8")) if metrics_path.exists() else {}
+    files = [p for p in live.iterdir() if p.is_file()]
+    vocab = getattr(vectorizer, "vocabulary_", None)
+    return {
+        "vocabulary_size": len(vocab) if vocab is not None else None,
+        "artifact_bytes": sum(p.stat().st_size for p in files),
+        "artifact_files": {p.name: p.stat().st_size for p in sorted(files)},
+        "accuracy": metrics.get("accuracy"),
+        "stage_wall_s": {name: t["wall_s"] for name, t in metrics.get("timings", {}).items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train on growing synthetic corpora to find where training falls over")
+    parser.add_argument("--data", type=str, default="dataset/sms_spam_no_header.csv",
+                        help="Labeled source CSV the synthetic corpora imitate")
+    parser.add_argument("--rows", type=str, default="100k,1m,10m", help="Comma-separated corpus sizes, e.g. 100k,1m,10m")
+    parser.add_argument("--work-dir", type=str, default="scaling_runs",
+                        help="Where corpora, artifacts and train.py logs are written")
+    parser.add_argument("--train-args", type=str, default=DEFAULT_TRAIN_ARGS,
+                        help="Extra train.py arguments, e.g. '--no-cache --streaming'")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds before a training run counts as failed")
+    parser.add_argument("--memory-limit-gb", type=float, default=None,
+                        help="Address-space limit for each training run (POSIX), to emulate a smaller machine")
+    parser.add_argument("--keep-going", action="store_true", help="Keep running larger sizes after a failure")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default="scaling_results.json", help="Where to write results")
+    args = parser.parse_args()
+
+    from dataset_cache import load_dataset
+
+    work_dir = Path(args.work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    texts, y, label_map = load_dataset(Path(args.data))
+    model = MarkovCorpus(texts, y)
+    label_names = {v: k for k, v in label_map.items()}
+    train_args = shlex.split(args.train_args)
+
+    runs = []
+    failure_point = None
+    for value in args.rows.split(","):
+        name = value.strip().lower()
+        n_rows = parse_rows(name)
+        csv_path = work_dir / f"synthetic_{name}.csv"
+        if not csv_path.exists():
+            print(f"[{name}] generating {n_rows:,} rows...")
+            write_corpus(model, csv_path, n_rows, args.seed, label_names)
+        out_dir = work_dir / f"artifacts_{name}"
+        print(f"[{name}] training: train.py {' '.join(train_args)}")
+        run = {"rows": n_rows, "csv_bytes": csv_path.stat().st_size,
+               **run_train(csv_path, out_dir, train_args, args.timeout, args.memory_limit_gb,
+                           work_dir / f"train_{name}.log")}
+        if run["failure"] is None:
+            run.update(describe_artifacts(out_dir))
+        runs.append(run)
+
+        rss = f"{run['peak_rss_mb']:,.0f} MB" if run["peak_rss_mb"] is not None else "n/a"
+        if run["failure"] is None:
+            print(f"[{name}] ok in {run['wall_s']:.1f}s | peak RSS {rss} | vocabulary {run['vocabulary_size']:,} "
+                  f"| artifacts {run['artifact_bytes'] / 1e6:,.1f} MB | accuracy {run['accuracy']:.4f}")
+        else:
+            print(f"[{name}] FAILED after {run['wall_s']:.1f}s | peak RSS {rss} | {run['failure']}")
+            if failure_point is None:
+                failure_point = n_rows
+            if not args.keep_going:
+                break
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": args.data,
+        "train_args": train_args,
+        "memory_limit_gb": args.memory_limit_gb,
+        "failure_point_rows": failure_point,
+        "largest_ok_rows": max((r["rows"] for r in runs if r["failure"] is None), default=None),
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    if failure_point is None:
+        print(f"No failures up to {runs[-1]['rows']:,} rows")
+    else:
+        print(f"Training first failed at {failure_point:,} rows")
+    print(f"Scaling results written to: {Path(args.output).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
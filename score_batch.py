@@ -0,0 +1,344 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from artifact_store import resolve_artifacts
+from cascade import CASCADE_NAME, load_prefilter
+from explain import Explainer, row_terms
+from instrumentation import StageTimer
+from model_bundle import BUNDLE_NAME, load_model
+from near_dup import NEAR_DUP_NAME, load_index
+from prediction_cache import PredictionCache
+
+
+# First cells of a headerless training CSV (label,text); see preprocess.map_labels.
+HEADERLESS_LABELS = ("ham", "spam", "0", "1")
+
+
+def detect_format(path: Path) -> str:
+    return "jsonl" if path.suffix.lower() in (".jsonl", ".ndjson") else "csv"
+
+
+def iter_csv_chunks(path: Path, chunk_size: int, text_column: str) -> Iterator[List[str]]:
+    import pandas as pd
+
+    # Use the header if it names the text column (case-insensitively). A first row
+    # that starts with a label is the headerless training CSV (label,text), whose
+    # last column is the text; anything else is a header without the column.
+    header = pd.read_csv(path, nrows=0, encoding="utf-8")
+    cols = [str(c).strip().lower() for c in header.columns]
+    wanted = text_column.strip().lower()
+    if wanted in cols:
+        reader = pd.read_csv(path, usecols=[header.columns[cols.index(wanted)]],
+                             chunksize=chunk_size, encoding="utf-8", dtype=str)
+    elif cols and cols[0] in HEADERLESS_LABELS:
+        reader = pd.read_csv(path, header=None, chunksize=chunk_size, encoding="utf-8", dtype=str)
+    else:
+        raise ValueError(f"{path.name} has no {text_column!r} column (header: {list(header.columns)}); "
+                         "set the text column, or use the headerless label,text layout")
+    for chunk in reader:
+        yield chunk.iloc[:, -1].fillna("").tolist()
+
+
+def record_text(record: dict, text_column: str):
+    if text_column in record:
+        return record[text_column]
+    wanted = text_column.strip().lower()
+    for key, value in record.items():
+        if str(key).strip().lower() == wanted:
+            return value
+    raise KeyError(text_column)
+
+
+def iter_jsonl_chunks(path: Path, chunk_size: int, text_column: str) -> Iterator[List[str]]:
+    batch = []
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            try:
+                text = record_text(record, text_column) if isinstance(record, dict) else record
+            except KeyError:
+                raise ValueError(f"{path.name}:{lineno} has no {text_column!r} key "
+                                 f"(keys: {list(record)}); set the text column") from None
+            batch.append("" if text is None else str(text))
+            if len(batch) >= chunk_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def iter_chunks(path: Path, chunk_size: int, text_column: str = "text") -> Iterator[List[str]]:
+    if detect_format(path) == "jsonl":
+        return iter_jsonl_chunks(path, chunk_size, text_column)
+    return iter_csv_chunks(path, chunk_size, text_column)
+
+
+def score_chunk(clf, vec, texts: List[str], cache: Optional[PredictionCache] = None,
+                timer: Optional[StageTimer] = None, fingerprint: Optional[tuple] = None) -> Tuple[np.ndarray, np.ndarray]:
+    if cache is not None:
+        return cache.score(texts, lambda misses: score_chunk(clf, vec, misses, timer=timer), fingerprint)
+    with timer.stage("transform", rows=len(texts)) if timer else nullcontext():
+        X = vec.transform(texts)
+    with timer.stage("decision_function", rows=len(texts)) if timer else nullcontext():
+        margins = np.asarray(clf.decision_function(X)).ravel()
+    labels = (margins > 0).astype(np.int8)
+    return labels, margins
+
+
+_WORKER = {}
+
+
+def score_cascade(prefilter, clf, vec, texts: List[str], cache: Optional[PredictionCache] = None):
+    """Answer confident messages from the prefilter; run the full model only inside its uncertainty band.
+
+    Early exits keep the prefilter's margin, so their margins are on a different scale.
+    """
+    margins = prefilter.decision_function(texts).astype(vec.dtype, copy=False)
+    labels = (margins > 0).astype(np.int8)
+    rest = np.where(prefilter.uncertain(margins))[0]
+    if len(rest):
+        labels[rest], margins[rest] = score_chunk(clf, vec, [texts[i] for i in rest], cache=cache)
+    return labels, margins, len(texts) - len(rest)
+
+
+def score_near_dup(index, texts: List[str], score) -> Tuple[np.ndarray, np.ndarray, int, int]:
+    """Answer known campaigns from the near-duplicate index; ``score`` handles the rest."""
+    matched, labels, margins = index.lookup(texts)
+    rest = np.where(~matched)[0]
+    early = 0
+    if len(rest):
+        labels[rest], margins[rest], early = score([texts[i] for i in rest])
+    return labels, margins, int(matched.sum()), early
+
+
+def _worker_init(art_dir: str, cache_size: int, near_dup: bool = False, cascade: bool = False,
+                 cascade_band: Optional[float] = None, explain: int = 0) -> None:
+    # load_model maps model.bundle read-only, so coef/IDF/vocabulary pages are
+    # shared by every worker through the page cache instead of unpickled per process.
+    clf, vec = load_model(Path(art_dir))
+    cache = PredictionCache(cache_size, art_dir=Path(art_dir)) if cache_size > 0 else None
+    index = load_index(Path(art_dir)) if near_dup else None
+    prefilter = load_prefilter(Path(art_dir), cascade_band) if cascade else None
+    explainer = Explainer(clf, vec, explain) if explain else None
+    _WORKER.update(clf=clf, vec=vec, cache=cache, near_dup=index, cascade=prefilter, explainer=explainer)
+
+
+def _worker_model_score(texts: List[str]) -> Tuple[np.ndarray, np.ndarray, int]:
+    if _WORKER["cascade"] is not None:
+        return score_cascade(_WORKER["cascade"], _WORKER["clf"], _WORKER["vec"], texts, cache=_WORKER["cache"])
+    labels, margins = score_chunk(_WORKER["clf"], _WORKER["vec"], texts, cache=_WORKER["cache"])
+    return labels, margins, 0
+
+
+def _worker_score(texts: List[str]) -> Tuple[np.ndarray, np.ndarray, int, int, Optional[dict]]:
+    """Score one chunk; returns (labels, margins, near-duplicate hits, cascade early exits, explanations)."""
+    if _WORKER["explainer"] is not None:
+        # Explanations need every message's feature row, so the cache is bypassed.
+        labels, margins, explanations = _WORKER["explainer"].explain(texts)
+        return labels, margins, 0, 0, explanations
+    if _WORKER["near_dup"] is not None:
+        return (*score_near_dup(_WORKER["near_dup"], texts, _worker_model_score), None)
+    labels, margins, early = _worker_model_score(texts)
+    return labels, margins, 0, early, None
+
+
+def score_serial(chunks: Iterable[List[str]], art_dir: Path, cache_size: int, near_dup: bool = False,
+                 cascade: bool = False, cascade_band: Optional[float] = None, explain: int = 0
+                 ) -> Iterator[Tuple[np.ndarray, np.ndarray, int, int, Optional[dict]]]:
+    _worker_init(str(art_dir), cache_size, near_dup, cascade, cascade_band, explain)
+    for texts in chunks:
+        yield _worker_score(texts)
+    if _WORKER["cache"] is not None and not explain:
+        cs = _WORKER["cache"].stats()
+        print(f"Cache: hits={cs['hits']} misses={cs['misses']} evictions={cs['evictions']} "
+              f"hit rate={cs['hit_rate']:.1%}")
+
+
+def score_parallel(chunks: Iterable[List[str]], art_dir: Path, workers: int, cache_size: int,
+                   near_dup: bool = False, cascade: bool = False, cascade_band: Optional[float] = None,
+                   explain: int = 0) -> Iterator[Tuple[np.ndarray, np.ndarray, int, int, Optional[dict]]]:
+    """Score chunks on ``workers`` processes, yielding results in input order."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    if art_dir.is_dir() and not (art_dir / BUNDLE_NAME).exists():
+        print(f"Warning: {BUNDLE_NAME} not found in {art_dir}; every worker unpickles the joblib artifacts",
+              file=sys.stderr)
+    with ProcessPoolExecutor(workers, initializer=_worker_init, initargs=(str(art_dir), cache_size, near_dup, cascade, cascade_band, explain)) as pool:
+        pending = deque()
+        for texts in chunks:
+            pending.append(pool.submit(_worker_score, texts))
+            # Bounded read-ahead: memory stays flat however large the input is.
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def score_file(input_path: Path, art_dir: Path, chunk_size: int, text_column: str, workers: int,
+               cache_size: int, writer: Optional["ResultWriter"] = None, progress: bool = True,
+               near_dup: bool = False, cascade: bool = False, cascade_band: Optional[float] = None,
+               explain: int = 0) -> dict:
+    # Pin the published version once so every worker scores with the same model
+    # even if a retrain switches CURRENT mid-run.
+    art_dir = resolve_artifacts(art_dir)
+    chunks = iter_chunks(input_path, chunk_size, text_column)
+    if workers > 1:
+        results = score_parallel(chunks, art_dir, workers, cache_size, near_dup, cascade, cascade_band, explain)
+    else:
+        results = score_serial(chunks, art_dir, cache_size, near_dup, cascade, cascade_band, explain)
+    n_done = 0
+    n_spam = 0
+    n_near_dup = 0
+    n_early = 0
+    t0 = time.perf_counter()
+    for labels, margins, hits, early, explanations in results:
+        n_near_dup += hits
+        n_early += early
+        if writer is not None:
+            writer.write(n_done, labels, margins, explanations)
+        n_done += len(labels)
+        n_spam += int(labels.sum())
+        if progress:
+            elapsed = time.perf_counter() - t0
+            print(f"Scored {n_done} messages ({n_done / max(elapsed, 1e-9):,.0f} msg/s)", file=sys.stderr)
+    elapsed = time.perf_counter() - t0
+    return {"messages": n_done, "spam": n_spam, "near_dup_hits": n_near_dup, "early_exits": n_early,
+            "elapsed_s": elapsed, "msgs_per_s": n_done / max(elapsed, 1e-9)}
+
+
+def scaling_report(args, worker_counts: List[int]) -> List[dict]:
+    # The cache is disabled so every run does the full tokenize + score work.
+    rows = []
+    for workers in worker_counts:
+        res = score_file(Path(args.input), Path(args.artifacts), args.chunk_size, args.text_column,
+                         workers, cache_size=0, progress=False)
+        res["workers"] = workers
+        base = rows[0] if rows else res
+        res["speedup"] = res["msgs_per_s"] / base["msgs_per_s"]
+        res["efficiency"] = res["speedup"] * base["workers"] / workers
+        rows.append(res)
+        print(f"workers={workers:>3} elapsed={res['elapsed_s']:7.2f}s throughput={res['msgs_per_s']:>12,.0f} msg/s "
+              f"speedup={res['speedup']:5.2f}x efficiency={res['efficiency']:6.1%}")
+    return rows
+
+
+def format_terms(pairs: List[Tuple[str, float]]) -> str:
+    # Analyzer terms never contain "|" or "=", so the cell needs no CSV quoting.
+    return "|".join(f"{t}={w:+.4f}" for t, w in pairs)
+
+
+class ResultWriter:
+    def __init__(self, path: Path, explain: bool = False):
+        self.path = path
+        self.format = detect_format(path)
+        self.explain = explain
+        self.f = open(path, "w", encoding="utf-8", newline="")
+        if self.format == "csv":
+            self.f.write("index,label,margin,top_spam,top_ham\n" if explain else "index,label,margin\n")
+
+    def write(self, start: int, labels: np.ndarray, margins: np.ndarray, explanations: Optional[dict] = None) -> None:
+        names = np.where(labels == 1, "spam", "ham")
+        if self.format == "csv":
+            lines = [f"{start + i},{n},{m:.6f}" for i, (n, m) in enumerate(zip(names, margins))]
+            if self.explain:
+                lines = [f"{line},{format_terms(row_terms(explanations, i, 'spam'))},"
+                         f"{format_terms(row_terms(explanations, i, 'ham'))}" for i, line in enumerate(lines)]
+            lines = [line + "\n" for line in lines]
+        else:
+            rows = [{"index": start + i, "label": str(n), "margin": round(float(m), 6)}
+                    for i, (n, m) in enumerate(zip(names, margins))]
+            if self.explain:
+                for i, row in enumerate(rows):
+                    row["top_spam"] = [[t, round(w, 6)] for t, w in row_terms(explanations, i, "spam")]
+                    row["top_ham"] = [[t, round(w, 6)] for t, w in row_terms(explanations, i, "ham")]
+            lines = [json.dumps(row) + "\n" for row in rows]
+        self.f.writelines(lines)
+
+    def close(self) -> None:
+        self.f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a CSV/JSONL file of messages in fixed-size chunks")
+    parser.add_argument("--input", type=str, required=True, help="CSV or JSONL file with messages")
+    parser.add_argument("--output", type=str, default=None, help="Output .csv or .jsonl with index,label,margin")
+    parser.add_argument("--artifacts", type=str, default="artifacts", help="Directory with model.bundle or model.joblib and vectorizer.joblib")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Messages scored per chunk")
+    parser.add_argument("--text-column", type=str, default="text", help="Column/key holding the message text")
+    parser.add_argument("--cache-size", type=int, default=100000,
+                        help="LRU prediction cache entries for repeated messages, per worker (0 disables)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes; chunks are sharded across them")
+    parser.add_argument("--near-dup", action="store_true",
+                        help="Answer near-duplicates of known messages from the artifacts' near_dup.npz without scoring")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Score with the artifacts' cascade.npz prefilter first; only uncertain messages reach the full model")
+    parser.add_argument("--cascade-band", type=float, default=None,
+                        help="Override the uncertainty band stored in cascade.npz")
+    parser.add_argument("--explain", type=int, default=0, metavar="K",
+                        help="Add each message's K strongest spam and ham terms (top_spam/top_ham); "
+                             "bypasses the prediction cache")
+    parser.add_argument("--scaling-report", type=str, default=None,
+                        help="Comma-separated worker counts to time instead of scoring, e.g. 1,2,4,8,16,32")
+    parser.add_argument("--report-output", type=str, default="scaling_report.json",
+                        help="Where --scaling-report writes its JSON results")
+    args = parser.parse_args()
+
+    if args.scaling_report:
+        counts = [int(w) for w in args.scaling_report.split(",") if w.strip()]
+        print(f"=== Scaling report ({os.cpu_count()} CPUs, chunk size {args.chunk_size}) ===")
+        rows = scaling_report(args, counts)
+        with open(args.report_output, "w", encoding="utf-8") as f:
+            json.dump({"input": args.input, "cpu_count": os.cpu_count(), "chunk_size": args.chunk_size,
+                       "runs": rows}, f, indent=2)
+        print(f"Scaling report written to: {Path(args.report_output).resolve()}")
+        return
+    if not args.output:
+        parser.error("--output is required unless --scaling-report is given")
+    if args.near_dup and not (resolve_artifacts(Path(args.artifacts)) / NEAR_DUP_NAME).exists():
+        parser.error(f"--near-dup needs near_dup.npz in {args.artifacts} (train with --dedup)")
+    if args.cascade and not (resolve_artifacts(Path(args.artifacts)) / CASCADE_NAME).exists():
+        parser.error(f"--cascade needs {CASCADE_NAME} in {args.artifacts} (train with --cascade)")
+
+    if args.explain < 0:
+        parser.error("--explain must be >= 0")
+    if args.explain and (args.near_dup or args.cascade):
+        parser.error("--explain needs the full model's features for every message; drop --near-dup/--cascade")
+
+    writer = ResultWriter(Path(args.output), explain=args.explain > 0)
+    try:
+        res = score_file(Path(args.input), Path(args.artifacts), args.chunk_size, args.text_column,
+                         args.workers, args.cache_size, writer=writer, near_dup=args.near_dup,
+                         cascade=args.cascade, cascade_band=args.cascade_band, explain=args.explain)
+    except ValueError as e:
+        # Unreadable input (missing text column or key, malformed JSON).
+        parser.error(str(e))
+    finally:
+        writer.close()
+
+    print("=== Batch scoring ===")
+    print(f"Messages: {res['messages']} | Spam: {res['spam']} | Ham: {res['messages'] - res['spam']} "
+          f"| Workers: {args.workers}")
+    print(f"Elapsed: {res['elapsed_s']:.2f}s | Throughput: {res['msgs_per_s']:,.0f} msg/s")
+    if args.near_dup:
+        print(f"Near-duplicate index answered {res['near_dup_hits']} messages "
+              f"({res['near_dup_hits'] / max(res['messages'], 1):.1%}) without scoring")
+    if args.cascade:
+        print(f"Cascade prefilter answered {res['early_exits']} messages "
+              f"({res['early_exits'] / max(res['messages'], 1):.1%}) without the full model")
+    print(f"Results written to: {Path(args.output).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from artifact_store import resolve_artifacts
+from model_bundle import load_model
+from prediction_cache import PredictionCache
+from score_batch import score_chunk
+
+
+class ServerStats:
+    def __init__(self, window: int = 10000):
+        self.started = time.perf_counter()
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.requests = 0
+        self.messages = 0
+        self.batches = 0
+
+    def record_batch(self, size: int) -> None:
+        self.batches += 1
+        self.messages += size
+        self.batch_sizes.append(size)
+
+    def record_request(self, latency_s: float) -> None:
+        self.requests += 1
+        self.latencies_ms.append(latency_s * 1000.0)
+
+    def snapshot(self) -> dict:
+        uptime = time.perf_counter() - self.started
+        lat = np.asarray(self.latencies_ms, dtype=float)
+        return {
+            "uptime_s": round(uptime, 3),
+            "requests": self.requests,
+            "messages": self.messages,
+            "batches": self.batches,
+            "throughput_msg_per_s": round(self.messages / max(uptime, 1e-9), 1),
+            "mean_batch_size": round(float(np.mean(self.batch_sizes)), 2) if self.batch_sizes else 0.0,
+            "latency_ms_p50": round(float(np.percentile(lat, 50)), 3) if lat.size else None,
+            "latency_ms_p99": round(float(np.percentile(lat, 99)), 3) if lat.size else None,
+        }
+
+
+class MicroBatcher:
+    """Collect concurrent messages for up to ``max_wait_ms`` and score them together."""
+
+    def __init__(self, clf, vec, stats: ServerStats, max_batch: int = 256, max_wait_ms: float = 2.0,
+                 cache: Optional[PredictionCache] = None):
+        self.clf = clf
+        self.vec = vec
+        self.cache = cache
+        self.stats = stats
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # Scoring runs off the event loop so new requests keep queueing meanwhile.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def submit(self, text: str) -> Tuple[int, float]:
+        fut = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, fut))
+        return await fut
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(items) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            texts = [t for t, _ in items]
+            try:
+                labels, margins = await loop.run_in_executor(
+                    self.executor, score_chunk, self.clf, self.vec, texts, self.cache
+                )
+            except Exception as e:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.stats.record_batch(len(items))
+            for (_, fut), label, margin in zip(items, labels, margins):
+                if not fut.done():
+                    fut.set_result((int(label), float(margin)))
+
+
+class InferenceServer:
+    def __init__(self, batcher: MicroBatcher, stats: ServerStats):
+        self.batcher = batcher
+        self.stats = stats
+
+    def stats_payload(self) -> dict:
+        payload = self.stats.snapshot()
+        if self.batcher.cache is not None:
+            payload["cache"] = self.batcher.cache.stats()
+        return payload
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = b""
+                length = int(headers.get("content-length", 0))
+                if length:
+                    body = await reader.readexactly(length)
+                status, payload = await self.route(method, path, body)
+                data = json.dumps(payload).encode("utf-8")
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method: str, path: str, body: bytes) -> Tuple[str, dict]:
+        if method == "GET" and path == "/stats":
+            return "200 OK", self.stats_payload()
+        if method == "GET" and path == "/healthz":
+            return "200 OK", {"status": "ok"}
+        if method == "POST" and path == "/predict":
+            try:
+                req = json.loads(body or b"{}")
+            except ValueError:
+                return "400 Bad Request", {"error": "invalid JSON body"}
+            if not isinstance(req, dict):
+                return "400 Bad Request", {"error": "expected a JSON object"}
+            single = "text" in req
+            texts: List[str] = [req["text"]] if single else req.get("texts", [])
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                return "400 Bad Request", {"error": "expected 'text' string or 'texts' list of strings"}
+            t0 = time.perf_counter()
+            results = await asyncio.gather(*(self.batcher.submit(t) for t in texts))
+            self.stats.record_request(time.perf_counter() - t0)
+            preds = [{"label": "spam" if lbl == 1 else "ham", "margin": m} for lbl, m in results]
+            return "200 OK", preds[0] if single else {"predictions": preds}
+        return "404 Not Found", {"error": f"no route for {method} {path}"}
+
+
+async def serve(args) -> None:
+    # The model is loaded once, so pin the cache to that version rather than to
+    # whatever CURRENT points at later.
+    art_dir = resolve_artifacts(Path(args.artifacts))
+    clf, vec = load_model(art_dir)
+    cache = PredictionCache(args.cache_size, art_dir=art_dir) if args.cache_size > 0 else None
+
+    stats = ServerStats()
+    batcher = MicroBatcher(clf, vec, stats, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, cache=cache)
+    app = InferenceServer(batcher, stats)
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(app.handle, args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port} "
+          f"(max_batch={args.max_batch}, max_wait_ms={args.max_wait_ms})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP inference server with micro-batching")
+    parser.add_argument("--artifacts", type=str, default="artifacts", help="Directory with model.bundle or model.joblib and vectorizer.joblib")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=256, help="Maximum messages scored per batch")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="Maximum time to wait while filling a batch")
+    parser.add_argument("--cache-size", type=int, default=100000,
+                        help="LRU prediction cache entries for repeated messages (0 disables)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,115 +1,260 @@
+import html
 import json
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
 from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
 
-import joblib
 import numpy as np
-import pandas as pd
 import streamlit as st
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics import accuracy_score, confusion_matrix, precision_recall_fscore_support
-from sklearn.model_selection import train_test_split
-from sklearn.svm import LinearSVC
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+from artifact_store import resolve_artifacts
+from explain import Explainer, row_terms
+from instrumentation import StageTimer
+from model_bundle import BUNDLE_NAME, load_model
+from prediction_cache import PredictionCache, artifact_fingerprint
+from score_batch import ResultWriter, iter_chunks, score_chunk
 
 ART_DIR = Path("artifacts")
-MODEL_PATH = ART_DIR / "model.joblib"
-VEC_PATH = ART_DIR / "vectorizer.joblib"
-METRICS_PATH = ART_DIR / "metrics.json"
-CM_IMG_PATH = ART_DIR / "confusion_matrix.png"
 DATASET_PATH = Path("dataset/sms_spam_no_header.csv")
+CACHE_SIZE = int(os.environ.get("SPAM_CACHE_SIZE", "10000"))
+BATCH_CHUNK_SIZE = 5000
+# Batch results are served by Streamlit's static file route (server.enableStaticServing),
+# which streams from disk instead of holding the file in memory like download_button.
+# Each run gets an unguessable directory; runs older than the TTL are swept, since
+# nothing tells the app when a session ends.
+BATCH_DIR = Path(__file__).resolve().parent / "static" / "batch"
+BATCH_URL = "app/static/batch"
+BATCH_TTL_S = int(os.environ.get("SPAM_BATCH_TTL_S", "3600"))
+# The static route refuses files over 200 MB, so larger results roll over into parts.
+BATCH_PART_BYTES = 128 << 20
+DATASET_URL = "https://raw.githubusercontent.com/PacktPublishing/Hands-On-Artificial-Intelligence-for-Cybersecurity/master/Chapter03/datasets/sms_spam_no_header.csv"
+
+
+# Shared across sessions; clears itself when the artifacts on disk change.
+@st.cache_resource(show_spinner=False)
+def get_prediction_cache():
+    return PredictionCache(CACHE_SIZE, art_dir=ART_DIR)
+
 
-# Auto-train on Streamlit Cloud if artifacts missing
-def ensure_artifacts():
-    if MODEL_PATH.exists() and VEC_PATH.exists():
+# Rolling window of per-request spans (transform / decision_function / classify).
+# Set SPAM_TRACE_FILE to also append them to a Chrome trace-event file.
+@st.cache_resource(show_spinner=False)
+def get_request_timer():
+    return StageTimer(max_spans=3000, track_memory=False)
+
+
+def sweep_batch_dirs(max_age_s: float = BATCH_TTL_S) -> None:
+    if not BATCH_DIR.exists():
         return
-    
-    with st.spinner("🚀 First-time setup: Downloading dataset and training model (this may take 1-2 minutes)..."):
+    cutoff = time.time() - max_age_s
+    for path in BATCH_DIR.iterdir():
+        try:
+            if path.is_dir() and path.stat().st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+# Runs once per server process, so results left behind by a previous run are removed.
+@st.cache_resource(show_spinner=False)
+def sweep_on_startup():
+    sweep_batch_dirs()
+    return True
+
+
+def count_lines(path: Path) -> int:
+    with open(path, "rb") as f:
+        return sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+
+
+def classify_upload(uploaded, text_column: str, clf, vec, progress, explainer: Optional[Explainer] = None) -> dict:
+    """Score an uploaded CSV/JSONL chunk by chunk, streaming results to files under BATCH_DIR.
+
+    With an ``explainer``, each row also gets its top spam and ham terms. Results
+    over BATCH_PART_BYTES are split into parts, each with its own header.
+    """
+    sweep_batch_dirs()
+    token = secrets.token_urlsafe(16)
+    out_dir = BATCH_DIR / token
+    out_dir.mkdir(parents=True)
+    stem = Path(Path(uploaded.name).name).stem
+    parts = []
+
+    def next_part() -> ResultWriter:
+        parts.append(f"{stem}_scored_part{len(parts) + 1}.csv")
+        return ResultWriter(out_dir / parts[-1], explain=explainer is not None)
+
+    n_done = 0
+    n_spam = 0
+    # The upload stays outside the served directory.
+    with tempfile.TemporaryDirectory(prefix="spam_batch_") as work_dir:
+        input_path = Path(work_dir) / Path(uploaded.name).name
+        with open(input_path, "wb") as f:
+            shutil.copyfileobj(uploaded, f, 1 << 20)
+        total = max(count_lines(input_path), 1)
+        writer = next_part()
+        try:
+            for texts in iter_chunks(input_path, BATCH_CHUNK_SIZE, text_column):
+                if explainer is not None:
+                    labels, margins, explanations = explainer.explain(texts)
+                else:
+                    labels, margins = score_chunk(clf, vec, texts)
+                    explanations = None
+                if writer.f.tell() >= BATCH_PART_BYTES:
+                    writer.close()
+                    writer = next_part()
+                writer.write(n_done, labels, margins, explanations)
+                n_done += len(texts)
+                n_spam += int(labels.sum())
+                progress.progress(min(n_done / total, 1.0), text=f"Scored {n_done:,} messages")
+        except BaseException:
+            # e.g. the text column or key is missing: leave nothing half-written behind.
+            shutil.rmtree(out_dir, ignore_errors=True)
+            raise
+        finally:
+            writer.close()
+    if len(parts) == 1:
+        (out_dir / parts[0]).rename(out_dir / f"{stem}_scored.csv")
+        parts = [f"{stem}_scored.csv"]
+    progress.progress(1.0, text=f"Scored {n_done:,} messages")
+    return {"dir": str(out_dir), "url": f"{BATCH_URL}/{token}", "files": parts, "rows": n_done, "spam": n_spam}
+
+
+def render_latency(timer: StageTimer) -> None:
+    latencies = np.array([s["wall_s"] * 1000 for s in timer.snapshot() if s["name"] == "classify"])
+    if not latencies.size:
+        st.info("Classify a message to start collecting latencies.")
+        return
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("p50", f"{np.percentile(latencies, 50):.2f} ms")
+    with col2:
+        st.metric("p99", f"{np.percentile(latencies, 99):.2f} ms")
+    counts, edges = np.histogram(latencies, bins=min(20, max(1, latencies.size)))
+    st.bar_chart({"requests": dict(zip(np.round(edges[:-1], 2).tolist(), counts.tolist()))})
+    stages = timer.summary()
+    for name in ("transform", "decision_function"):
+        if name in stages:
+            st.caption(f"{name}: {stages[name]['wall_s'] / stages[name]['count'] * 1000:.2f} ms avg "
+                       f"over {stages[name]['count']} calls")
+    st.caption(f"Last {latencies.size} requests (cache hits skip transform/decision_function)")
+
+
+def has_artifacts(art_dir: Path) -> bool:
+    return (art_dir / BUNDLE_NAME).exists() or (
+        (art_dir / "model.joblib").exists() and (art_dir / "vectorizer.joblib").exists())
+
+
+def load_metrics(art_dir: Path):
+    path = art_dir / "metrics.json"
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+class BackgroundTrainer:
+    """Runs train.py on a daemon thread and publishes a new artifact version under ART_DIR.
+
+    Sessions keep scoring with the model they loaded; the next rerun after the
+    CURRENT pointer moves picks up the new version.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.status = "idle"
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self) -> bool:
+        with self.lock:
+            if self.running:
+                return False
+            # Training dependencies load here, on the script thread, so the
+            # inference path stays light and imports resolve like the app's own.
+            from train import main as train_main
+
+            self.status, self.error, self.started, self.finished = "running", None, time.time(), None
+            self.thread = threading.Thread(target=self._run, args=(train_main,),
+                                           name="spam-trainer", daemon=True)
+            self.thread.start()
+            return True
+
+    def _run(self, train_main) -> None:
         try:
-            # Download dataset
             if not DATASET_PATH.exists():
-                DATASET_PATH.parent.mkdir(parents=True, exist_ok=True)
                 import urllib.request
-                url = "https://raw.githubusercontent.com/PacktPublishing/Hands-On-Artificial-Intelligence-for-Cybersecurity/master/Chapter03/datasets/sms_spam_no_header.csv"
-                urllib.request.urlretrieve(url, str(DATASET_PATH))
-                st.success("✅ Dataset downloaded")
-            
-            # Train inline (avoid subprocess issues)
-            ART_DIR.mkdir(parents=True, exist_ok=True)
-            
-            # Load data
-            df = pd.read_csv(DATASET_PATH, header=None, names=["label", "text"], encoding="utf-8")
-            df = df.dropna(subset=["label", "text"])
-            df["text"] = df["text"].astype(str).str.strip()
-            df = df[df["text"].str.len() > 0]
-            
-            # Map labels
-            label_map = {"ham": 0, "spam": 1}
-            y = df["label"].str.strip().str.lower().map(label_map).values
-            X_text = df["text"].values
-            
-            # Split
-            X_train, X_test, y_train, y_test = train_test_split(
-                X_text, y, test_size=0.2, random_state=42, stratify=y
-            )
-            
-            # Vectorize
-            vectorizer = TfidfVectorizer(
-                lowercase=True, analyzer="word", ngram_range=(1, 2),
-                max_features=50000, min_df=2, stop_words="english"
-            )
-            X_train_vec = vectorizer.fit_transform(X_train)
-            X_test_vec = vectorizer.transform(X_test)
-            
-            # Train
-            clf = LinearSVC(random_state=42)
-            clf.fit(X_train_vec, y_train)
-            
-            # Evaluate
-            y_pred = clf.predict(X_test_vec)
-            acc = accuracy_score(y_test, y_pred)
-            precision, recall, f1, _ = precision_recall_fscore_support(y_test, y_pred, average="weighted", zero_division=0)
-            cm = confusion_matrix(y_test, y_pred)
-            
-            # Save artifacts
-            metrics = {
-                "accuracy": acc,
-                "precision_weighted": precision,
-                "recall_weighted": recall,
-                "f1_weighted": f1,
-                "seed": 42,
-                "test_size": 0.2,
-            }
-            with open(METRICS_PATH, "w", encoding="utf-8") as f:
-                json.dump(metrics, f, indent=2)
-            
-            # Save confusion matrix plot
-            fig, ax = plt.subplots(figsize=(4, 3))
-            sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-                        xticklabels=["ham", "spam"], yticklabels=["ham", "spam"], ax=ax)
-            ax.set_xlabel("Predicted")
-            ax.set_ylabel("True")
-            plt.tight_layout()
-            plt.savefig(CM_IMG_PATH)
-            plt.close()
-            
-            # Save model & vectorizer
-            joblib.dump(clf, MODEL_PATH)
-            joblib.dump(vectorizer, VEC_PATH)
-            
-            st.success(f"✅ Training complete! Accuracy: {acc:.4f}")
-            st.balloons()
-            st.rerun()
-            
-        except Exception as e:
-            st.error(f"❌ Training failed: {e}")
-            st.stop()
 
-ensure_artifacts()
+                DATASET_PATH.parent.mkdir(parents=True, exist_ok=True)
+                urllib.request.urlretrieve(DATASET_URL, str(DATASET_PATH))
+            train_main(["--data", str(DATASET_PATH), "--out", str(ART_DIR), "--publish"])
+            self.status = "done"
+        except BaseException as e:  # argparse errors surface as SystemExit
+            self.error = str(e) or type(e).__name__
+            self.status = "failed"
+        finally:
+            self.finished = time.time()
+
+
+# One trainer per server process, shared by every session.
+@st.cache_resource(show_spinner=False)
+def get_trainer():
+    return BackgroundTrainer()
+
+
+# Keyed by the live version, so a publish loads the new model on the next rerun
+# while runs already holding the old (clf, vec) finish with it.
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_artifacts(art_dir: str, fingerprint: tuple):
+    try:
+        return load_model(Path(art_dir))
+    except Exception as e:
+        st.error(f"Failed to load artifacts: {e}")
+        return None, None
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_explainer(art_dir: str, fingerprint: tuple):
+    clf, vec = load_artifacts(art_dir, fingerprint)
+    return Explainer(clf, vec) if clf is not None else None
+
+
+@st.fragment(run_every=2)
+def training_status(trainer: BackgroundTrainer, loaded_dir: Path):
+    if trainer.running:
+        st.info(f"⏳ Training a new model in the background ({time.time() - trainer.started:.0f}s)...")
+    elif trainer.status == "failed":
+        st.error(f"❌ Training failed: {trainer.error}")
+    elif resolve_artifacts(ART_DIR) != loaded_dir and has_artifacts(resolve_artifacts(ART_DIR)):
+        # A new version was published; rerun the whole app to swap it in.
+        st.rerun(scope="app")
+
 
 st.set_page_config(page_title="SMS Spam Classifier", page_icon="📬", layout="wide")
 st.title("📬 SMS Spam Classifier (Baseline: LinearSVC + TF‑IDF)")
 
+# Resolve the live version once per run; everything below reads from it.
+active_dir = resolve_artifacts(ART_DIR)
+trainer = get_trainer()
+sweep_on_startup()
+if not has_artifacts(active_dir) and trainer.status != "failed":
+    # First start (e.g. Streamlit Cloud): train without blocking the page.
+    trainer.start()
+
 # Sidebar: 優化版側邊欄
 with st.sidebar:
     st.markdown("### 🎯 About This App")
@@ -122,9 +267,9 @@ with st.sidebar:
     
     # Model Performance (可摺疊)
     with st.expander("📊 Model Performance", expanded=False):
-        if METRICS_PATH.exists():
+        metrics = load_metrics(active_dir)
+        if metrics is not None:
             try:
-                metrics = json.loads(METRICS_PATH.read_text(encoding="utf-8"))
                 col1, col2 = st.columns(2)
                 with col1:
                     st.metric("Accuracy", f"{metrics.get('accuracy', 0):.3f}")
@@ -141,8 +286,9 @@ with st.sidebar:
     
     # Confusion Matrix (可摺疊)
     with st.expander("🔍 Confusion Matrix", expanded=False):
-        if CM_IMG_PATH.exists():
-            st.image(str(CM_IMG_PATH), use_container_width=True)
+        cm_img_path = active_dir / "confusion_matrix.png"
+        if cm_img_path.exists():
+            st.image(str(cm_img_path), use_container_width=True)
             st.caption("Visual breakdown of model predictions")
         else:
             st.info("Confusion matrix will appear after training.")
@@ -160,6 +306,23 @@ with st.sidebar:
         labeled for spam detection research.
         """)
     
+    # Prediction Cache (可摺疊)
+    with st.expander("⚡ Prediction Cache", expanded=False):
+        cache_stats = get_prediction_cache().stats()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Hit Rate", f"{cache_stats['hit_rate']:.1%}")
+            st.metric("Hits", cache_stats["hits"])
+        with col2:
+            st.metric("Entries", f"{cache_stats['size']}/{cache_stats['capacity']}")
+            st.metric("Misses", cache_stats["misses"])
+        st.caption(f"Evictions: {cache_stats['evictions']} | Invalidations: {cache_stats['invalidations']}")
+
+    # Request Latency (可摺疊); filled in at the end of the run so it includes
+    # the request this run just classified.
+    with st.expander("⏱️ Request Latency", expanded=False):
+        latency_panel = st.container()
+
     # Quick Stats (固定顯示)
     st.markdown("---")
     st.markdown("### 📈 Quick Stats")
@@ -168,8 +331,13 @@ with st.sidebar:
         st.metric("Model", "LinearSVC")
         st.metric("Features", "TF-IDF")
     with stat_col2:
-        st.metric("Train Time", "~2 min")
-        st.metric("Status", "✅ Ready")
+        train_time = (load_metrics(active_dir) or {}).get("train_time_s")
+        st.metric("Train Time", f"{train_time:.1f} s" if train_time is not None else "n/a")
+        st.metric("Status", "⏳ Training" if trainer.running else "✅ Ready")
+    if st.button("🔄 Retrain in background", use_container_width=True, disabled=trainer.running):
+        trainer.start()
+        st.rerun()
+    training_status(trainer, active_dir)
     
     st.markdown("---")
     st.markdown("""
@@ -180,22 +348,22 @@ with st.sidebar:
     """, unsafe_allow_html=True)
 
 # Load model/vectorizer
-@st.cache_resource(show_spinner=False)
-def load_artifacts():
-    if not MODEL_PATH.exists() or not VEC_PATH.exists():
-        return None, None
-    try:
-        clf = joblib.load(MODEL_PATH)
-        vec = joblib.load(VEC_PATH)
-        return clf, vec
-    except Exception as e:
-        st.error(f"Failed to load artifacts: {e}")
-        return None, None
-
-clf, vec = load_artifacts()
+# The fingerprint the model was loaded under also keys the prediction cache, so a
+# run still holding an older model never stores its scores for a newer one.
+model_fp = artifact_fingerprint(active_dir)
+if has_artifacts(active_dir):
+    clf, vec = load_artifacts(str(active_dir), model_fp)
+else:
+    clf, vec = None, None
 
 if clf is None or vec is None:
-    st.error("Artifacts not found. Please run training to create 'artifacts/model.joblib' and 'artifacts/vectorizer.joblib'.")
+    if trainer.running:
+        st.info("🚀 First-time setup: downloading the dataset and training the model in the background "
+                "(this may take 1-2 minutes). The page refreshes when it is ready.")
+    else:
+        st.error("Artifacts not found. Please run training to create 'artifacts/model.bundle'.")
+    with latency_panel:
+        render_latency(get_request_timer())
     st.stop()
 
 colL, colR = st.columns([3, 2])
@@ -276,19 +444,11 @@ with colL:
             st.warning("⚠️ Please enter some text.")
         else:
             with st.spinner("Analyzing..."):
-                X = vec.transform([text])
-                pred = clf.predict(X)[0]
-                
-                # Get decision margin
-                margin = None
-                try:
-                    margin = clf.decision_function(X)
-                    if np.ndim(margin) > 1:
-                        margin = margin[0]
-                    else:
-                        margin = float(margin)
-                except Exception:
-                    pass
+                timer = get_request_timer()
+                with timer.stage("classify"):
+                    labels, margins = score_chunk(clf, vec, [text], cache=get_prediction_cache(), timer=timer, fingerprint=model_fp)
+                pred = labels[0]
+                margin = float(margins[0])
 
                 label = "SPAM" if int(pred) == 1 else "HAM"
                 is_spam = (label == "SPAM")
@@ -344,6 +504,51 @@ with colL:
                     The decision margin represents how far the message is from the decision boundary. 
                     Larger absolute values indicate higher confidence.
                     """)
+                    explainer = get_explainer(str(active_dir), model_fp)
+                    if explainer is not None:
+                        _, _, explanations = explainer.explain([text])
+                        st.markdown("**Top contributing terms** (TF-IDF weight × SVM coefficient; "
+                                    "they add up to the margin minus the intercept)")
+                        exp_spam, exp_ham = st.columns(2)
+                        for col, side, title in ((exp_spam, "spam", "🚫 Toward spam"), (exp_ham, "ham", "✅ Toward ham")):
+                            with col:
+                                st.markdown(f"*{title}*")
+                                pairs = row_terms(explanations, 0, side)
+                                st.markdown("\n".join(f"- `{t}` {w:+.4f}" for t, w in pairs) if pairs else "—")
+
+with colL:
+    st.markdown("---")
+    st.subheader("📂 Batch classification")
+    uploaded = st.file_uploader("Upload a CSV or JSONL file of messages", type=["csv", "jsonl", "ndjson"])
+    text_column = st.text_input("Text column / key", value="text",
+                                help="Matched case-insensitively. CSV files whose first row starts with a label "
+                                     "(ham/spam/0/1) are read like the training data (last column)")
+    explain_batch = st.checkbox("Add top contributing terms per message (top_spam / top_ham columns)")
+    if uploaded is not None and st.button("📊 Classify file", use_container_width=True):
+        previous = st.session_state.pop("batch_result", None)
+        if previous:
+            shutil.rmtree(previous["dir"], ignore_errors=True)
+        progress = st.progress(0.0, text="Starting...")
+        try:
+            explainer = get_explainer(str(active_dir), model_fp) if explain_batch else None
+            st.session_state["batch_result"] = classify_upload(uploaded, text_column.strip() or "text",
+                                                               clf, vec, progress, explainer)
+        except Exception as e:
+            st.error(f"❌ Could not classify file: {e}")
+
+    result = st.session_state.get("batch_result")
+    if result and Path(result["dir"]).exists():
+        st.success(f"✅ {result['rows']:,} messages: {result['spam']:,} spam / "
+                   f"{result['rows'] - result['spam']:,} ham")
+        links = [f'<a href="{result["url"]}/{quote(name)}" download="{html.escape(name)}">⬇️ {html.escape(name)}</a>'
+                 for name in result["files"]]
+        st.markdown("Download results (index, label, margin[, top terms]): " + " · ".join(links),
+                    unsafe_allow_html=True)
+        if len(result["files"]) > 1:
+            st.caption(f"Split into {len(result['files'])} parts of up to {BATCH_PART_BYTES >> 20} MB; "
+                       "the index column continues across parts.")
+    elif result:
+        st.info(f"Batch results are kept for {BATCH_TTL_S // 60} minutes; classify the file again to download it.")
 
 with colR:
     st.subheader("📖 How this works")
@@ -366,3 +571,6 @@ with colR:
         - Confidence based on decision boundary distance
         """
     )
+
+with latency_panel:
+    render_latency(get_request_timer())
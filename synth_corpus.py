@@ -0,0 +1,169 @@
+import argparse
+import csv
+import time
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+# Rows generated per block; bounds the (messages x max length) token array.
+BLOCK_ROWS = 20000
+# Exponent of the Zipf draw for novel words: n draws yield about n**(1/a) distinct
+# words, close to the vocabulary growth (Heaps' law) of real message corpora.
+NOVEL_ZIPF_A = 1.6
+_LETTERS = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+
+
+def parse_rows(value: str) -> int:
+    value = value.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * scale)
+
+
+def novel_word(k: int) -> str:
+    # Base-26 spelling, at least three letters so it survives the token pattern.
+    letters = []
+    k += 26 * 26
+    while k:
+        k, r = divmod(k, 26)
+        letters.append(_LETTERS[r])
+    return "".join(letters)
+
+
+class _Chain:
+    """Word-bigram transitions as one sorted key array for vectorized sampling.
+
+    State 0 is the message boundary: chains start there and a draw of 0 ends
+    the message.
+    """
+
+    def __init__(self, prev: np.ndarray, nxt: np.ndarray, n_states: int):
+        keys, counts = np.unique(prev.astype(np.int64) * n_states + nxt, return_counts=True)
+        self.prev = keys // n_states
+        self.next = (keys % n_states).astype(np.int32)
+        totals = np.bincount(self.prev, weights=counts, minlength=n_states)
+        # Row-local cumulative probability offset by the row id: sampling a row is
+        # a searchsorted of (state + u) over the whole table.
+        cum = np.cumsum(counts).astype(np.float64)
+        row_start = np.concatenate([[0], np.cumsum(totals)[:-1]])
+        self.keys = self.prev + (cum - row_start[self.prev]) / totals[self.prev]
+        self.row_end = np.searchsorted(self.prev, np.arange(n_states), side="right")
+
+    def sample(self, states: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        idx = np.searchsorted(self.keys, states + rng.random(len(states)), side="left")
+        return self.next[np.minimum(idx, self.row_end[states] - 1)]
+
+
+class MarkovCorpus:
+    """Per-class word-bigram Markov generator fitted on a labeled corpus.
+
+    Keeps the source's label balance, message lengths (chains end where real
+    messages end) and word transitions. Tokens are replaced by novel words at
+    the source's hapax rate, so the vocabulary keeps growing with corpus size
+    instead of saturating at the source's.
+    """
+
+    def __init__(self, texts, y: np.ndarray):
+        y = np.asarray(y)
+        words = [t.split() for t in texts]
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        vocab, inverse = np.unique(np.array([w for ws in words for w in ws], dtype=str), return_inverse=True)
+        ids = inverse.astype(np.int64) + 1
+        self.vocab = np.concatenate([[""], vocab.astype(object)])
+        self.max_len = int(lengths.max())
+        self.classes = np.unique(y)
+        self.prior = np.array([(y == c).mean() for c in self.classes])
+        self.novel_rate = float((np.bincount(ids) == 1).sum() / max(len(ids), 1))
+
+        # Messages laid end to end as 0 w1 .. wn 0 w1 .. 0, so each message
+        # contributes bigrams (0, w1) .. (wn, 0) and none cross messages.
+        seq = np.zeros(len(ids) + len(words) + 1, dtype=np.int64)
+        seq[np.arange(len(ids)) + np.repeat(np.arange(1, len(words) + 1), lengths)] = ids
+        pair_class = np.repeat(y, lengths + 1)
+        self.chains = {c: _Chain(seq[:-1][pair_class == c], seq[1:][pair_class == c], len(self.vocab))
+                       for c in self.classes}
+
+    def _block(self, label, n: int, rng: np.random.Generator) -> List[str]:
+        chain = self.chains[label]
+        tokens = np.zeros((n, self.max_len), dtype=np.int64)
+        state = np.zeros(n, dtype=np.int64)
+        alive = np.arange(n)
+        for t in range(self.max_len):
+            nxt = chain.sample(state[alive], rng)
+            keep = nxt != 0
+            alive, nxt = alive[keep], nxt[keep]
+            if not len(alive):
+                break
+            tokens[alive, t] = nxt
+            state[alive] = nxt
+        mask = tokens != 0
+        novel = mask & (rng.random(tokens.shape) < self.novel_rate)
+        words = self.vocab[tokens[mask]]
+        if novel.any():
+            draws = rng.zipf(NOVEL_ZIPF_A, size=int(novel.sum()))
+            uniq, inv = np.unique(draws, return_inverse=True)
+            rendered = np.array([novel_word(int(k)) for k in uniq], dtype=object)
+            words[novel[mask]] = rendered[inv]
+        ends = np.cumsum(mask.sum(axis=1))
+        starts = ends - mask.sum(axis=1)
+        return [" ".join(words[a:b]) for a, b in zip(starts, ends)]
+
+    def iter_blocks(self, n_rows: int, seed: int,
+                    block_rows: int = BLOCK_ROWS) -> Iterator[Tuple[np.ndarray, List[str]]]:
+        """Yield (labels, texts) blocks totalling ``n_rows`` messages in random label order."""
+        rng = np.random.default_rng(seed)
+        for start in range(0, n_rows, block_rows):
+            n = min(block_rows, n_rows - start)
+            labels = self.classes[rng.choice(len(self.classes), size=n, p=self.prior)]
+            texts = np.empty(n, dtype=object)
+            for c in self.classes:
+                rows = np.where(labels == c)[0]
+                if len(rows):
+                    texts[rows] = self._block(c, len(rows), rng)
+            yield labels, list(texts)
+
+    def sample(self, n_rows: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+        blocks = list(self.iter_blocks(n_rows, seed))
+        texts = np.asarray([t for _, b in blocks for t in b], dtype=object)
+        return texts, np.concatenate([labels for labels, _ in blocks]) if blocks else np.zeros(0, dtype=int)
+
+
+def write_corpus(model: MarkovCorpus, path: Path, n_rows: int, seed: int, label_names: dict) -> dict:
+    """Stream ``n_rows`` generated messages to a headerless label,text CSV like the bundled dataset."""
+    t0 = time.perf_counter()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n_spam = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        for labels, texts in model.iter_blocks(n_rows, seed):
+            n_spam += int((labels == 1).sum())
+            writer.writerows(zip((label_names[int(v)] for v in labels), texts))
+    return {"path": str(path), "rows": n_rows, "spam": n_spam, "bytes": path.stat().st_size,
+            "elapsed_s": time.perf_counter() - t0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic SMS corpora from the bundled dataset's statistics")
+    parser.add_argument("--data", type=str, default="dataset/sms_spam_no_header.csv", help="Labeled source CSV (label,text)")
+    parser.add_argument("--rows", type=str, default="100k,1m,10m", help="Comma-separated corpus sizes, e.g. 100k,1m,10m")
+    parser.add_argument("--out-dir", type=str, default="dataset/synthetic", help="Where synthetic_<rows>.csv files go")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from dataset_cache import load_dataset
+
+    texts, y, label_map = load_dataset(Path(args.data))
+    model = MarkovCorpus(texts, y)
+    label_names = {v: k for k, v in label_map.items()}
+    print(f"Source: {len(texts)} messages, vocabulary {len(model.vocab) - 1}, spam share "
+          f"{float(np.mean(y == 1)):.1%}, novel-word rate {model.novel_rate:.2%}")
+    for value in args.rows.split(","):
+        n_rows = parse_rows(value)
+        res = write_corpus(model, Path(args.out_dir) / f"synthetic_{value.strip().lower()}.csv", n_rows,
+                           args.seed, label_names)
+        print(f"{res['rows']:>10,} rows -> {res['path']} ({res['bytes'] / 1e6:,.1f} MB, "
+              f"spam {res['spam'] / max(n_rows, 1):.1%}, {res['elapsed_s']:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
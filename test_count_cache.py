@@ -0,0 +1,69 @@
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from count_cache import analyzer_params, fit_from_counts, load_counts
+from dataset_cache import load_dataset
+from train import build_classifier, build_vectorizer
+
+# None keeps the training default (50000, not binding on the bundled dataset);
+# the small caps force ties at the max_features cutoff.
+DEFAULT_MAX_FEATURES = "none,500,1000,3000"
+COEF_RTOL = 1e-2
+
+
+def compare(texts, y, max_features, seed: int) -> list:
+    """Fit once with fit_transform and once from cached counts; return the mismatches."""
+    direct = build_vectorizer()
+    direct.set_params(max_features=max_features)
+    X_direct = direct.fit_transform(texts)
+
+    cached = build_vectorizer()
+    cached.set_params(max_features=max_features)
+    counts, names, _ = load_counts(None, texts, analyzer_params(cached))
+    cols, tfidf = fit_from_counts(cached, counts, names)
+    X_cached = tfidf.transform(counts[:, cols].astype(cached.dtype))
+
+    errors = []
+    if cached.vocabulary_ != direct.vocabulary_:
+        only_direct = set(direct.vocabulary_) - set(cached.vocabulary_)
+        errors.append(f"vocabulary_ differs ({len(direct.vocabulary_)} vs {len(cached.vocabulary_)} terms, "
+                      f"{len(only_direct)} only in fit_transform)")
+        return errors
+    if not np.allclose(cached.idf_, direct.idf_, rtol=0, atol=1e-12):
+        errors.append(f"idf_ differs (max {np.abs(cached.idf_ - direct.idf_).max():.2e})")
+    if abs(X_cached - X_direct).max() > 1e-12:
+        errors.append("TF-IDF matrices differ")
+    coef_direct = build_classifier(seed).fit(X_direct, y).coef_
+    coef_cached = build_classifier(seed).fit(X_cached, y).coef_
+    # liblinear stops at tol=1e-4, so last-bit differences in X (row norms summed in
+    # another order) move the weights by up to the solver tolerance.
+    coef_diff = np.linalg.norm(coef_cached - coef_direct) / max(np.linalg.norm(coef_direct), 1e-12)
+    if coef_diff > COEF_RTOL:
+        errors.append(f"coef_ differs (relative L2 {coef_diff:.2e})")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that training from cached counts matches fit_transform")
+    parser.add_argument("--data", type=str, default="dataset/sms_spam_no_header.csv", help="Labeled CSV (label,text)")
+    parser.add_argument("--max-features", type=str, default=DEFAULT_MAX_FEATURES,
+                        help="Comma-separated max_features values to check ('none' for the training default)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    texts, y, _ = load_dataset(Path(args.data), use_cache=False)
+    failed = False
+    for value in args.max_features.split(","):
+        max_features = build_vectorizer().max_features if value.strip().lower() == "none" else int(value)
+        errors = compare(texts, y, max_features, args.seed)
+        print(f"max_features={max_features}: {'OK' if not errors else 'FAIL: ' + '; '.join(errors)}")
+        failed |= bool(errors)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
+import time
+
+_START = time.perf_counter()
+
 import argparse
+import sys
 from pathlib import Path
-import joblib
+
+from model_bundle import load_model
 
 samples = [
     "Congratulations! You've won a free ticket. Reply WIN to claim.",
@@ -9,20 +15,31 @@ samples = [
     "Lunch at 12?",
 ]
 
+# Modules only the training path needs; loading any of them here slows cold start.
+TRAINING_ONLY_MODULES = ("matplotlib", "seaborn", "sklearn.svm", "sklearn.model_selection")
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--artifacts", type=str, default="artifacts", help="Directory with model.joblib and vectorizer.joblib")
+    parser.add_argument("--artifacts", type=str, default="artifacts", help="Directory with model.bundle or model.joblib and vectorizer.joblib")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if time to first prediction exceeds this many ms")
     args = parser.parse_args()
 
-    art = Path(args.artifacts)
-    clf = joblib.load(art / "model.joblib")
-    vec = joblib.load(art / "vectorizer.joblib")
+    clf, vec = load_model(Path(args.artifacts))
 
     X = vec.transform(samples)
     preds = clf.predict(X)
+    first_prediction_ms = (time.perf_counter() - _START) * 1000
     for text, p in zip(samples, preds):
         label = "spam" if p == 1 else "ham"
         print(f"[{label}] {text}")
 
+    print(f"Time to first prediction: {first_prediction_ms:.1f} ms")
+    heavy = [m for m in TRAINING_ONLY_MODULES if m in sys.modules]
+    if heavy:
+        print(f"Warning: training-only modules imported on the inference path: {', '.join(heavy)}")
+    if args.budget_ms is not None and first_prediction_ms > args.budget_ms:
+        print(f"FAIL: time to first prediction exceeds budget of {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
 if __name__ == "__main__":
     main()
@@ -2,7 +2,7 @@ import argparse
 import json
 import os
 from pathlib import Path
-from typing import Tuple
+from typing import Iterator, List, Tuple
 
 import joblib
 import numpy as np
@@ -16,148 +16,750 @@ from sklearn.metrics import (
 )
 from sklearn.model_selection import train_test_split
 from sklearn.svm import LinearSVC
-import matplotlib.pyplot as plt
-import seaborn as sns
 
+from artifact_store import current_version, is_published, resolve_artifacts, staging_dir
+from cascade import CASCADE_NAME, DEFAULT_BAND, DEFAULT_FEATURES, Prefilter
+from count_cache import analyzer_params, fit_from_counts, load_counts
+from dataset_cache import load_dataset
+from fused_scorer import FUSED_NAME, export_fused
+from instrumentation import StageTimer, best_time
+from model_bundle import BUNDLE_NAME, COMPACT_BUNDLE_NAME, QUANTIZE_MODES, load_bundle, save_bundle
+from near_dup import DEFAULT_MIN_COUNT, NEAR_DUP_NAME, dedup_rows
+from preprocess import ngram_orders, select_vocabulary
+
+# Files derived from one trained model; a run that does not regenerate one deletes it.
+OPTIONAL_ARTIFACTS = (CASCADE_NAME, NEAR_DUP_NAME, COMPACT_BUNDLE_NAME, FUSED_NAME)
 
 def ensure_out_dir(out_dir: Path) -> None:
     out_dir.mkdir(parents=True, exist_ok=True)
 
 
-def read_dataset(path: Path) -> pd.DataFrame:
-    # Try headerless first
-    try:
-        df = pd.read_csv(path, header=None, names=["label", "text"], encoding="utf-8")
-    except Exception:
-        # Fallback to autodetect
-        df = pd.read_csv(path, encoding="utf-8")
-    # Normalize columns
-    cols = [c.strip().lower() for c in df.columns]
-    df.columns = cols
-    if "label" not in df.columns or "text" not in df.columns:
-        # Try infer if there are exactly two columns
-        if len(df.columns) == 2:
-            df.columns = ["label", "text"]
-        else:
-            raise ValueError(
-                f"Expected columns ['label','text'] in {path}, got: {df.columns.tolist()}"
-            )
-    # Drop NA and empty
-    df = df.dropna(subset=["label", "text"]).copy()
-    df["text"] = df["text"].astype(str).str.strip()
-    df = df[df["text"].str.len() > 0]
-    return df
-
-
-def map_labels(labels: pd.Series) -> Tuple[np.ndarray, dict]:
-    # Standard dataset uses 'ham' / 'spam'. Handle common variants.
-    label_map = {}
-    l = labels.astype(str).str.strip().str.lower()
-    unique = sorted(l.unique())
-    if set(unique).issubset({"ham", "spam"}):
-        label_map = {"ham": 0, "spam": 1}
-        y = l.map(label_map).values
-    elif set(unique).issubset({"0", "1"}):
-        label_map = {"0": 0, "1": 1}
-        y = l.map(label_map).values
-    else:
-        # Fallback: make the most frequent class 0 and the other 1
-        counts = l.value_counts()
-        classes = list(counts.index[:2])
-        label_map = {classes[0]: 0, classes[1]: 1}
-        y = l.map(label_map).values
-    return y, label_map
-
-
 def plot_confusion(cm: np.ndarray, out_path: Path, class_names=("ham", "spam")) -> None:
-    plt.figure(figsize=(4, 3))
+    # Plotting libraries are slow to import; load them only when a plot is drawn.
+    # A bare Figure (no pyplot state) is safe when training runs off the main thread.
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(4, 3))
+    ax = fig.subplots()
     sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", cbar=False,
-                xticklabels=class_names, yticklabels=class_names)
-    plt.xlabel("Predicted")
-    plt.ylabel("True")
-    plt.tight_layout()
-    plt.savefig(out_path)
-    plt.close()
+                xticklabels=class_names, yticklabels=class_names, ax=ax)
+    ax.set_xlabel("Predicted")
+    ax.set_ylabel("True")
+    fig.tight_layout()
+    fig.savefig(out_path)
+
+
+def build_vectorizer(dtype=np.float64) -> TfidfVectorizer:
+    return TfidfVectorizer(
+        lowercase=True,
+        analyzer="word",
+        ngram_range=(1, 2),
+        max_features=50000,
+        min_df=2,
+        stop_words="english",
+        dtype=dtype,
+    )
+
+
+def build_classifier(seed: int, balanced: bool = False) -> LinearSVC:
+    return LinearSVC(class_weight=("balanced" if balanced else None), random_state=seed)
+
+
+def cast_weights(clf, dtype) -> None:
+    # liblinear and SGD always fit in float64; store the weights in the feature dtype
+    # so decision_function keeps float32 inputs float32 end to end.
+    clf.coef_ = np.asarray(clf.coef_, dtype=dtype)
+    clf.intercept_ = np.asarray(clf.intercept_, dtype=dtype)
+
+
+def evaluate(y_true, y_pred, sample_weight=None) -> Tuple[dict, np.ndarray]:
+    acc = accuracy_score(y_true, y_pred, sample_weight=sample_weight)
+    precision, recall, f1, _ = precision_recall_fscore_support(
+        y_true, y_pred, average="weighted", zero_division=0, sample_weight=sample_weight
+    )
+    report = classification_report(y_true, y_pred, labels=[0, 1], target_names=["ham", "spam"],
+                                   output_dict=True, zero_division=0, sample_weight=sample_weight)
+    cm = confusion_matrix(y_true, y_pred, labels=[0, 1], sample_weight=sample_weight)
+    metrics = {
+        "accuracy": acc,
+        "precision_weighted": precision,
+        "recall_weighted": recall,
+        "f1_weighted": f1,
+        "classification_report": report,
+    }
+    return metrics, cm.astype(int)
+
+
+def save_model_artifacts(clf, vectorizer, out_dir: Path) -> List[str]:
+    """Write the model files and return the names of the optional artifacts written."""
+    joblib.dump(clf, out_dir / "model.joblib")
+    joblib.dump(vectorizer, out_dir / "vectorizer.joblib")
+    save_bundle(clf, vectorizer, out_dir / BUNDLE_NAME)
+    if not hasattr(vectorizer, "vocabulary_"):
+        return []
+    export_fused(vectorizer, clf, out_dir / FUSED_NAME)
+    return [FUSED_NAME]
+
+
+def remove_stale_artifacts(out_dir: Path, written) -> None:
+    # Each of these was built from one particular model; left behind after a retrain
+    # it would be loaded next to weights it does not belong to.
+    for name in OPTIONAL_ARTIFACTS:
+        if name not in written:
+            (out_dir / name).unlink(missing_ok=True)
+
+
+def save_holdout(texts, y, out_dir: Path) -> None:
+    # Kept so incremental updates can report accuracy on the same test split.
+    joblib.dump({"texts": list(texts), "y": np.asarray(y)}, out_dir / "holdout.joblib")
+
+
+def measure_bundle(path: Path, texts, y) -> dict:
+    import time
+    import tracemalloc
+
+    # Load + first transform, since the term dict is built lazily on first use.
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    clf, vec = load_bundle(path)
+    vec.transform(list(texts[:1]))
+    load_s = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    y_pred = clf.predict(vec.transform(list(texts)))
+    return {
+        "bytes": path.stat().st_size,
+        "load_s": load_s,
+        "memory_mb": peak / 1e6,
+        "accuracy": accuracy_score(y, y_pred),
+    }
+
+
+def export_compact(clf, vectorizer, texts, y, out_dir: Path, quantize: str, threshold: float) -> dict:
+    """Write a pruned, quantized bundle and compare it with the full one on (texts, y)."""
+    coef = np.ravel(clf.coef_)
+    keep = np.where(np.abs(coef) >= threshold)[0]
+    save_bundle(clf, vectorizer, out_dir / COMPACT_BUNDLE_NAME, keep=keep, quantize=quantize)
+    full = measure_bundle(out_dir / BUNDLE_NAME, texts, y)
+    compact = measure_bundle(out_dir / COMPACT_BUNDLE_NAME, texts, y)
+    margins = [np.asarray(c.decision_function(v.transform(list(texts)))).ravel()
+               for c, v in (load_bundle(out_dir / n) for n in (BUNDLE_NAME, COMPACT_BUNDLE_NAME))]
+    return {
+        "quantize": quantize,
+        "prune_threshold": threshold,
+        "n_features_full": int(coef.size),
+        "n_features": int(keep.size),
+        # The pickles carry stop_words_ (every term cut by min_df/max_features); bundles never do.
+        "joblib_bytes": sum((out_dir / n).stat().st_size for n in ("model.joblib", "vectorizer.joblib")),
+        "full": full,
+        "compact": compact,
+        "accuracy_delta": compact["accuracy"] - full["accuracy"],
+        "max_margin_delta": float(np.abs(margins[1] - margins[0]).max()) if len(texts) else 0.0,
+    }
+
+
+def evaluate_cascade(prefilter, clf, vectorizer, texts, y) -> dict:
+    """Compare the cascade with the full model on (texts, y): early exits, throughput, accuracy."""
+    texts = list(texts)
+    full = np.asarray(clf.decision_function(vectorizer.transform(texts))).ravel()
+    stage1 = prefilter.decision_function(texts)
+    uncertain = prefilter.uncertain(stage1)
+    pred = np.where(uncertain, full > 0, stage1 > 0).astype(int)
+
+    def run_cascade():
+        m = prefilter.decision_function(texts)
+        rest = [t for t, u in zip(texts, prefilter.uncertain(m)) if u]
+        if rest:
+            clf.decision_function(vectorizer.transform(rest))
+
+    full_s = best_time(lambda: clf.decision_function(vectorizer.transform(texts)))
+    cascade_s = best_time(run_cascade)
+    full_acc = accuracy_score(y, (full > 0).astype(int))
+    cascade_acc = accuracy_score(y, pred)
+    return {
+        "band": prefilter.band,
+        "n_features": prefilter.n_features,
+        "early_exit_fraction": float(1.0 - uncertain.mean()),
+        "stage1_accuracy": accuracy_score(y, (stage1 > 0).astype(int)),
+        "full_accuracy": full_acc,
+        "cascade_accuracy": cascade_acc,
+        "accuracy_delta": cascade_acc - full_acc,
+        "agreement": float((pred == (full > 0)).mean()),
+        "full_msgs_per_s": len(texts) / max(full_s, 1e-9),
+        "cascade_msgs_per_s": len(texts) / max(cascade_s, 1e-9),
+        "throughput_gain": full_s / max(cascade_s, 1e-9),
+    }
+
+
+def sparse_nbytes(X) -> int:
+    return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+
+
+def compare_dtypes(train_counts, test_counts, feature_names, test_texts, y_train, y_test, seed: int,
+                   balanced: bool = False) -> dict:
+    """Fit the TF-IDF + LinearSVC pipeline in float64 and float32 on the same split and compare them.
+
+    Peaks are numpy/Python heap (tracemalloc). LinearSVC copies its input to
+    float64 before fitting, so the training peak shrinks less than the matrices.
+    """
+    import tempfile
+    import time
+    import tracemalloc
+
+    texts = list(test_texts)
+    report = {}
+    margins = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in (np.float64, np.float32):
+            name = np.dtype(dtype).name
+            vec = build_vectorizer(dtype)
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            cols, tfidf = fit_from_counts(vec, train_counts, feature_names)
+            X_train = tfidf.transform(train_counts[:, cols].astype(dtype))
+            clf = build_classifier(seed, balanced)
+            clf.fit(X_train, y_train)
+            cast_weights(clf, dtype)
+            train_s = time.perf_counter() - t0
+            _, train_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            X_test = tfidf.transform(test_counts[:, cols].astype(dtype))
+
+            bundle = Path(tmp) / f"{name}.bundle"
+            save_bundle(clf, vec, bundle)
+            b_clf, b_vec = load_bundle(bundle)
+            b_vec.transform(texts[:1])
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            m = np.asarray(b_clf.decision_function(b_vec.transform(texts))).ravel()
+            score_s = time.perf_counter() - t0
+            _, score_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            margins[name] = m
+            report[name] = {
+                "train_matrix_bytes": sparse_nbytes(X_train),
+                "test_matrix_bytes": sparse_nbytes(X_test),
+                "model_bytes": clf.coef_.nbytes + vec.idf_.nbytes,
+                "bundle_bytes": bundle.stat().st_size,
+                "train_peak_mb": train_peak / 1e6,
+                "train_s": train_s,
+                "score_peak_mb": score_peak / 1e6,
+                "score_bytes_per_msg": score_peak / max(len(texts), 1),
+                "score_msgs_per_s": len(texts) / max(score_s, 1e-9),
+                "margin_dtype": m.dtype.name,
+                "accuracy": accuracy_score(y_test, (m > 0).astype(int)),
+            }
+    wide, narrow = margins["float64"], margins["float32"]
+    report["agreement"] = float(((wide > 0) == (narrow > 0)).mean())
+    report["max_abs_margin_diff"] = float(np.abs(wide - narrow).max()) if len(wide) else 0.0
+    report["accuracy_delta"] = report["float32"]["accuracy"] - report["float64"]["accuracy"]
+    return report
+
+
+def print_dtype_report(report: dict) -> None:
+    wide, narrow = report["float64"], report["float32"]
+    print("=== float64 vs float32 ===")
+    rows = [
+        ("train matrix (MB)", "train_matrix_bytes", 1e6),
+        ("test matrix (MB)", "test_matrix_bytes", 1e6),
+        ("coef + idf (KB)", "model_bytes", 1e3),
+        ("bundle (KB)", "bundle_bytes", 1e3),
+        ("train peak (MB)", "train_peak_mb", 1),
+        ("score peak (MB)", "score_peak_mb", 1),
+        ("score bytes/msg", "score_bytes_per_msg", 1),
+        ("score msg/s", "score_msgs_per_s", 1),
+    ]
+    print(f"{'':<20}{'float64':>12}{'float32':>12}{'ratio':>8}")
+    for label, key, scale in rows:
+        ratio = narrow[key] / wide[key] if wide[key] else float("nan")
+        print(f"{label:<20}{wide[key] / scale:>12,.1f}{narrow[key] / scale:>12,.1f}{ratio:>8.2f}")
+    print(f"Accuracy: float64 {wide['accuracy']:.4f} | float32 {narrow['accuracy']:.4f} "
+          f"({report['accuracy_delta']:+.4f}) | agreement {report['agreement']:.4f} "
+          f"| max margin diff {report['max_abs_margin_diff']:.2e}")
+
+
+def write_metrics(metrics: dict, timer: StageTimer, out_dir: Path) -> None:
+    stages = timer.summary()
+    metrics["timings"] = stages
+    metrics["train_time_s"] = sum(s["wall_s"] for s in stages.values())
+    with open(out_dir / "metrics.json", "w", encoding="utf-8") as f:
+        json.dump(metrics, f, indent=2)
+
+
+def print_summary(metrics: dict) -> None:
+    # Simple console summary
+    print("=== Results ===")
+    print(f"Accuracy: {metrics['accuracy']:.4f}")
+    print(f"Weighted Precision: {metrics['precision_weighted']:.4f} | "
+          f"Recall: {metrics['recall_weighted']:.4f} | F1: {metrics['f1_weighted']:.4f}")
+
+
+STREAMING_LABEL_MAPS = ({"ham": 0, "spam": 1}, {"0": 0, "1": 1})
+
+
+def iter_dataset_chunks(path: Path, chunk_size: int) -> Iterator[pd.DataFrame]:
+    # Streaming counterpart of read_dataset: same cleaning, one chunk at a time.
+    reader = pd.read_csv(path, header=None, names=["label", "text"], usecols=[0, 1],
+                         chunksize=chunk_size, encoding="utf-8", dtype=str)
+    for chunk in reader:
+        chunk = chunk.dropna(subset=["label", "text"]).copy()
+        chunk["label"] = chunk["label"].str.strip().str.lower()
+        chunk["text"] = chunk["text"].str.strip()
+        yield chunk[chunk["text"].str.len() > 0]
+
+
+def split_mask(n: int, chunk_idx: int, seed: int, test_size: float) -> np.ndarray:
+    # Deterministic per-chunk hold-out assignment, identical on every epoch.
+    rng = np.random.default_rng([seed, chunk_idx])
+    return rng.random(n) < test_size
 
 
-def main():
+def train_streaming(args, data_path: Path, out_dir: Path, timer: StageTimer) -> None:
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import SGDClassifier
+
+    vectorizer = HashingVectorizer(
+        lowercase=True,
+        analyzer="word",
+        ngram_range=(1, 2),
+        stop_words="english",
+        n_features=args.n_features,
+        alternate_sign=False,
+        norm="l2",
+        dtype=feature_dtype(args),
+    )
+    # Squared hinge: LinearSVC's default loss, so the streaming model fits the same
+    # objective as the batch one, only incrementally.
+    clf = SGDClassifier(loss="squared_hinge", alpha=args.alpha, random_state=args.seed)
+
+    label_map = None
+    n_train = n_test = n_skipped = 0
+    for epoch in range(args.epochs):
+        print(f"Epoch {epoch + 1}/{args.epochs}: streaming {data_path} in chunks of {args.chunk_size}...")
+        with timer.stage(f"epoch_{epoch + 1}"):
+            for chunk_idx, chunk in enumerate(iter_dataset_chunks(data_path, args.chunk_size)):
+                if label_map is None:
+                    seen = set(chunk["label"].unique())
+                    label_map = max(STREAMING_LABEL_MAPS, key=lambda m: len(seen & set(m)))
+                y = chunk["label"].map(label_map)
+                known = y.notna().values
+                test = split_mask(len(chunk), chunk_idx, args.seed, args.test_size)
+                train_rows = known & ~test
+                if epoch == 0:
+                    n_skipped += int((~known).sum())
+                    n_train += int(train_rows.sum())
+                    n_test += int((known & test).sum())
+                if not train_rows.any():
+                    continue
+                X = vectorizer.transform(chunk["text"].values[train_rows])
+                clf.partial_fit(X, y.values[train_rows].astype(int), classes=np.array([0, 1]))
+    if label_map is None or n_train == 0:
+        raise ValueError(f"No trainable rows found in {data_path}")
+    print(f"Streamed rows: train={n_train} test={n_test} skipped={n_skipped}")
+
+    # Accumulate the confusion matrix chunk by chunk so evaluation memory stays flat.
+    print("Evaluating...")
+    with timer.stage("evaluate"):
+        cm = np.zeros((2, 2), dtype=np.int64)
+        for chunk_idx, chunk in enumerate(iter_dataset_chunks(data_path, args.chunk_size)):
+            y = chunk["label"].map(label_map)
+            rows = y.notna().values & split_mask(len(chunk), chunk_idx, args.seed, args.test_size)
+            if not rows.any():
+                continue
+            y_pred = clf.predict(vectorizer.transform(chunk["text"].values[rows]))
+            cm += confusion_matrix(y.values[rows].astype(int), y_pred, labels=[0, 1])
+        metrics, cm = evaluate([0, 0, 1, 1], [0, 1, 0, 1], sample_weight=cm.ravel())
+    with timer.stage("plot_confusion"):
+        plot_confusion(cm, out_dir / "confusion_matrix.png")
+    cast_weights(clf, feature_dtype(args))
+    with timer.stage("save_artifacts"):
+        remove_stale_artifacts(out_dir, save_model_artifacts(clf, vectorizer, out_dir))
+    metrics.update({
+        "label_map": label_map,
+        "seed": args.seed,
+        "test_size": args.test_size,
+        "dtype": np.dtype(feature_dtype(args)).name,
+        "mode": "streaming",
+        "n_features": args.n_features,
+        "epochs": args.epochs,
+        "n_train_docs": n_train,
+        "model_version": 1,
+    })
+    write_metrics(metrics, timer, out_dir)
+    timer.print_table()
+    print_summary(metrics)
+
+
+def feature_dtype(args):
+    return np.float32 if args.float32 else np.float64
+
+
+def parse_list(value: str, cast) -> list:
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def parse_ngram(value: str) -> Tuple[int, int]:
+    lo, _, hi = value.partition("-")
+    return int(lo), int(hi or lo)
+
+
+# Where --sweep writes on a published root, next to CURRENT and versions/.
+SWEEP_NAME = "sweep.json"
+_SWEEP_STATE = {}
+
+
+def _sweep_init(counts, orders, y, folds) -> None:
+    _SWEEP_STATE.update(counts=counts, orders=orders, y=y, folds=folds)
+
+
+def _sweep_task(task) -> list:
+    import time
+    from sklearn.feature_extraction.text import TfidfTransformer
+
+    cpu0 = time.process_time()
+    fold_idx, ngram_range, min_df, max_features, c_values, balanced, seed = task
+    counts, orders, y = _SWEEP_STATE["counts"], _SWEEP_STATE["orders"], _SWEEP_STATE["y"]
+    train_idx, val_idx = _SWEEP_STATE["folds"][fold_idx]
+
+    # One feature selection + TF-IDF per (fold, vectorizer settings), shared by every C.
+    fold_counts = counts[train_idx]
+    cols = select_vocabulary(fold_counts, orders, ngram_range, min_df, max_features)
+    tfidf = TfidfTransformer()
+    X_tr = tfidf.fit_transform(fold_counts[:, cols])
+    X_val = tfidf.transform(counts[val_idx][:, cols])
+
+    results = []
+    for c in c_values:
+        clf = LinearSVC(C=c, class_weight=("balanced" if balanced else None), random_state=seed)
+        clf.fit(X_tr, y[train_idx])
+        y_pred = clf.predict(X_val)
+        _, _, f1, _ = precision_recall_fscore_support(y[val_idx], y_pred, average="weighted", zero_division=0)
+        results.append({
+            "ngram_range": list(ngram_range), "min_df": min_df, "max_features": max_features, "C": c,
+            "fold": fold_idx, "accuracy": accuracy_score(y[val_idx], y_pred), "f1_weighted": f1,
+            "n_features": int(len(cols)),
+        })
+    cpu = time.process_time() - cpu0
+    for r in results:
+        r["cpu_time_s"] = cpu / len(results)
+    return results
+
+
+def sweep_ngram_range(args) -> Tuple[int, int]:
+    return 1, max(hi for _, hi in (parse_ngram(v) for v in args.grid_ngram.split(",")))
+
+
+def run_sweep(args, counts, feature_names, y: np.ndarray, tokenize: dict) -> dict:
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import product
+    from sklearn.model_selection import StratifiedKFold
+
+    wall0 = time.perf_counter()
+    cpu0 = time.process_time()
+    ngrams = [parse_ngram(v) for v in args.grid_ngram.split(",")]
+    min_dfs = parse_list(args.grid_min_df, int)
+    max_feats = [None if v.lower() == "none" else int(v) for v in args.grid_max_features.split(",")]
+    c_values = parse_list(args.grid_c, float)
+
+    # The corpus is tokenized once at the widest n-gram range (sweep_ngram_range);
+    # every configuration and fold slices this count matrix instead of refitting
+    # a vectorizer on raw text.
+    orders = ngram_orders(feature_names)
+
+    skf = StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=args.seed)
+    folds = list(skf.split(np.zeros(len(y)), y))
+    tasks = [
+        (f, ng, md, mf, c_values, args.balanced, args.seed)
+        for f, ng, md, mf in product(range(args.folds), ngrams, min_dfs, max_feats)
+    ]
+    workers = args.workers or os.cpu_count() or 1
+    print(f"Running {len(tasks) * len(c_values)} fits ({args.folds}-fold CV) on {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_sweep_init,
+                             initargs=(counts, orders, y, folds)) as pool:
+        fold_results = [r for batch in pool.map(_sweep_task, tasks) for r in batch]
+
+    grouped = {}
+    for r in fold_results:
+        key = (tuple(r["ngram_range"]), r["min_df"], r["max_features"], r["C"])
+        grouped.setdefault(key, []).append(r)
+    table = []
+    for (ng, md, mf, c), rows in grouped.items():
+        f1s = np.array([r["f1_weighted"] for r in rows])
+        accs = np.array([r["accuracy"] for r in rows])
+        table.append({
+            "ngram_range": list(ng), "min_df": md, "max_features": mf, "C": c,
+            "f1_weighted_mean": float(f1s.mean()), "f1_weighted_std": float(f1s.std()),
+            "accuracy_mean": float(accs.mean()), "accuracy_std": float(accs.std()),
+            "n_features_mean": float(np.mean([r["n_features"] for r in rows])),
+        })
+    table.sort(key=lambda r: (-r["f1_weighted_mean"], -r["accuracy_mean"]))
+    for rank, row in enumerate(table, start=1):
+        row["rank"] = rank
+
+    # Both totals cover tokenization (the count_matrix stage) plus the sweep itself.
+    wall = time.perf_counter() - wall0 + tokenize["wall_s"]
+    cpu = time.process_time() - cpu0 + tokenize["cpu_s"] + sum(r["cpu_time_s"] for r in fold_results)
+    return {
+        "folds": args.folds,
+        "workers": workers,
+        "n_fits": len(fold_results),
+        "tokenize_time_s": tokenize["wall_s"],
+        "wall_time_s": wall,
+        "cpu_time_s": cpu,
+        "cpu_utilization": cpu / (wall * workers),
+        "results": table,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Train baseline SMS spam classifier (LinearSVC)")
     parser.add_argument("--data", type=str, default="dataset/sms_spam_no_header.csv",
                         help="Path to CSV with columns: label,text")
     parser.add_argument("--out", type=str, default="artifacts", help="Output directory for artifacts")
+    parser.add_argument("--publish", action="store_true",
+                        help="Write a new version under <out>/versions and switch <out>/CURRENT to it atomically "
+                             "(implied when <out> already has a CURRENT file)")
     parser.add_argument("--seed", type=int, default=42, help="Random seed")
     parser.add_argument("--test-size", type=float, default=0.2, help="Test split size")
     parser.add_argument("--balanced", action="store_true", help="Use class_weight='balanced' for LinearSVC")
+    parser.add_argument("--trace-file", type=str, default=None,
+                        help="Append per-stage spans to this Chrome trace-event file (or set SPAM_TRACE_FILE)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Re-parse and re-tokenize instead of using the dataset and count-matrix caches next to the CSV")
+    parser.add_argument("--float32", action="store_true",
+                        help="Build features and store weights/IDF as float32 instead of float64 (half the memory)")
+    parser.add_argument("--dtype-report", action="store_true",
+                        help="Also fit float64 and float32 pipelines on the same split and compare memory and accuracy")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Out-of-core training: hashed features + SGD squared hinge loss over CSV chunks")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows per chunk in --streaming mode")
+    parser.add_argument("--epochs", type=int, default=5, help="Passes over the data in --streaming mode")
+    parser.add_argument("--n-features", type=int, default=2 ** 20, help="Hashed feature space size in --streaming mode")
+    parser.add_argument("--alpha", type=float, default=1e-5, help="SGD regularization strength in --streaming mode")
+    parser.add_argument("--sweep", action="store_true",
+                        help="k-fold CV over a vectorizer/classifier grid on the training split (writes metrics.json['sweep'], or <out>/sweep.json on a published root)")
+    parser.add_argument("--folds", type=int, default=5, help="CV folds in --sweep mode")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes in --sweep mode (default: all cores)")
+    parser.add_argument("--grid-ngram", type=str, default="1-1,1-2", help="Comma-separated n-gram ranges, e.g. 1-1,1-2")
+    parser.add_argument("--grid-min-df", type=str, default="1,2", help="Comma-separated min_df values")
+    parser.add_argument("--grid-max-features", type=str, default="10000,50000,none",
+                        help="Comma-separated max_features values ('none' for unlimited)")
+    parser.add_argument("--grid-c", type=str, default="0.1,1,10", help="Comma-separated LinearSVC C values")
+    parser.add_argument("--compact", choices=QUANTIZE_MODES, default=None,
+                        help=f"Also export {COMPACT_BUNDLE_NAME}: pruned features, weights/IDF stored as float16 or int8")
+    parser.add_argument("--prune-threshold", type=float, default=0.05,
+                        help="Drop features with |coef| below this from the --compact export")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Collapse near-duplicate messages (MinHash/LSH) before splitting and save the index")
+    parser.add_argument("--dedup-threshold", type=float, default=0.8, help="Jaccard similarity for --dedup")
+    parser.add_argument("--dedup-num-perm", type=int, default=64, help="MinHash permutations for --dedup")
+    parser.add_argument("--dedup-min-cluster", type=int, default=DEFAULT_MIN_COUNT,
+                        help="Only clusters with at least this many messages go into the saved index")
+    parser.add_argument("--dedup-max-entries", type=int, default=100000,
+                        help="Clusters kept in the saved near-duplicate index (largest first)")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Also train a hashed char-trigram prefilter (cascade.npz) that answers confident "
+                             "messages before the full model")
+    parser.add_argument("--cascade-band", type=float, default=DEFAULT_BAND,
+                        help="Prefilter margins within this distance of 0 go to the full model")
+    parser.add_argument("--cascade-features", type=int, default=DEFAULT_FEATURES,
+                        help="Hash buckets for the prefilter (power of two)")
+    return parser
 
-    args = parser.parse_args()
 
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.streaming and args.balanced:
+        parser.error("--balanced is not supported with --streaming")
+    if args.streaming and args.sweep:
+        parser.error("--sweep cannot be combined with --streaming")
+    if args.streaming and args.dedup:
+        parser.error("--dedup cannot be combined with --streaming")
+    if args.streaming and args.compact:
+        parser.error("--compact cannot be combined with --streaming")
+    if args.streaming and args.dtype_report:
+        parser.error("--dtype-report cannot be combined with --streaming")
+    if args.streaming and args.cascade:
+        parser.error("--cascade cannot be combined with --streaming")
+    if args.dedup_min_cluster < 1:
+        parser.error("--dedup-min-cluster must be >= 1")
+    if args.cascade_features & (args.cascade_features - 1):
+        parser.error("--cascade-features must be a power of two")
+
+    out_root = Path(args.out)
+    if args.sweep or not (args.publish or is_published(out_root)):
+        # --sweep publishes nothing; on a published root its results go to the root
+        # (SWEEP_NAME), never into the live version.
+        out_dir = out_root
+        ensure_out_dir(out_dir)
+        run_training(args, out_dir)
+        if not args.sweep:
+            print(f"Artifacts saved to: {out_dir.resolve()}")
+        return
+    # Report the published version, not the staging directory it was renamed from.
+    with staging_dir(out_root) as out_dir:
+        run_training(args, out_dir)
+    print(f"Published version {current_version(out_root)} in {out_root.resolve()}")
+    print(f"Artifacts saved to: {resolve_artifacts(out_root).resolve()}")
+
+
+def run_training(args, out_dir: Path) -> None:
     data_path = Path(args.data)
-    out_dir = Path(args.out)
-    ensure_out_dir(out_dir)
+    timer = StageTimer(args.trace_file)
+    if args.streaming:
+        train_streaming(args, data_path, out_dir, timer)
+        return
 
     print(f"Loading dataset from: {data_path}")
-    df = read_dataset(data_path)
-    print(f"Dataset rows after cleaning: {len(df)}")
+    with timer.stage("load_dataset"):
+        X_text, y, label_map = load_dataset(data_path, use_cache=not args.no_cache)
+    print(f"Dataset rows after cleaning: {len(X_text)}")
 
-    y, label_map = map_labels(df["label"])
-    X_text = df["text"].values
+    # Token and n-gram counts of the whole cleaned corpus, cached by a hash of the
+    # texts plus the analyzer settings; pruning and TF-IDF are refit from them, so
+    # later runs with other min_df/max_features/seed/classifier options skip tokenizing.
+    vectorizer = build_vectorizer(feature_dtype(args))
+    params = analyzer_params(vectorizer)
+    if args.sweep:
+        params["ngram_range"] = sweep_ngram_range(args)
+    with timer.stage("count_matrix", rows=len(X_text)):
+        counts, feature_names, hit = load_counts(None if args.no_cache else data_path, X_text, params)
+    print(f"Count matrix {'loaded from cache' if hit else 'tokenized'}: "
+          f"{counts.shape[0]} docs x {counts.shape[1]} n-grams")
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_text, y, test_size=args.test_size, random_state=args.seed, stratify=y
-    )
+    near_dup = None
+    if args.dedup:
+        n_before = len(X_text)
+        with timer.stage("dedup", rows=n_before):
+            keep, near_dup = dedup_rows(X_text, y, args.dedup_threshold, args.dedup_num_perm,
+                                        args.dedup_max_entries, args.dedup_min_cluster)
+        X_text, y = X_text[keep], y[keep]
+        counts = counts[np.where(keep)[0]]
+        dedup_info = {"rows_before": n_before, "rows_after": int(len(X_text)), "index_entries": len(near_dup),
+                      **near_dup.params()}
+        print(f"Near-duplicate dedup: {n_before} -> {len(X_text)} rows ({len(near_dup)} clusters indexed)")
 
-    vectorizer = TfidfVectorizer(
-        lowercase=True,
-        analyzer="word",
-        ngram_range=(1, 2),
-        max_features=50000,
-        min_df=2,
-        stop_words="english",
-    )
+    with timer.stage("split"):
+        idx_train, idx_test = train_test_split(
+            np.arange(len(X_text)), test_size=args.test_size, random_state=args.seed, stratify=y
+        )
+        X_train, X_test = X_text[idx_train], X_text[idx_test]
+        y_train, y_test = y[idx_train], y[idx_test]
+
+    if args.sweep:
+        sweep = run_sweep(args, counts[idx_train], feature_names, y_train, timer.summary()["count_matrix"])
+        if is_published(out_dir):
+            metrics_path = out_dir / SWEEP_NAME
+            tmp = metrics_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"sweep": sweep}, indent=2), encoding="utf-8")
+            os.replace(tmp, metrics_path)
+        else:
+            metrics_path = out_dir / "metrics.json"
+            metrics = json.loads(metrics_path.read_text(encoding="utf-8")) if metrics_path.exists() else {}
+            metrics["sweep"] = sweep
+            with open(metrics_path, "w", encoding="utf-8") as f:
+                json.dump(metrics, f, indent=2)
+        print("=== Sweep (top 5 by weighted F1) ===")
+        for row in sweep["results"][:5]:
+            print(f"#{row['rank']} ngram={tuple(row['ngram_range'])} min_df={row['min_df']} "
+                  f"max_features={row['max_features']} C={row['C']} "
+                  f"F1={row['f1_weighted_mean']:.4f}±{row['f1_weighted_std']:.4f}")
+        print(f"Wall time: {sweep['wall_time_s']:.1f}s | CPU time: {sweep['cpu_time_s']:.1f}s "
+              f"| CPU utilization: {sweep['cpu_utilization']:.0%} of {sweep['workers']} workers")
+        print(f"Sweep results written to: {metrics_path.resolve()}")
+        return
 
     print("Fitting TF-IDF vectorizer...")
-    X_train_vec = vectorizer.fit_transform(X_train)
-    X_test_vec = vectorizer.transform(X_test)
+    with timer.stage("fit_transform", rows=len(X_train)):
+        train_counts = counts[idx_train]
+        cols, tfidf = fit_from_counts(vectorizer, train_counts, feature_names)
+        X_train_vec = tfidf.transform(train_counts[:, cols].astype(vectorizer.dtype))
+    with timer.stage("transform_test", rows=len(X_test)):
+        X_test_vec = tfidf.transform(counts[idx_test][:, cols].astype(vectorizer.dtype))
 
     print("Training LinearSVC baseline...")
-    clf = LinearSVC(class_weight=("balanced" if args.balanced else None), random_state=args.seed)
-    clf.fit(X_train_vec, y_train)
+    clf = build_classifier(args.seed, args.balanced)
+    with timer.stage("classifier_fit"):
+        clf.fit(X_train_vec, y_train)
+        cast_weights(clf, vectorizer.dtype)
 
     print("Evaluating...")
-    y_pred = clf.predict(X_test_vec)
-    acc = accuracy_score(y_test, y_pred)
-    precision, recall, f1, support = precision_recall_fscore_support(y_test, y_pred, average="weighted", zero_division=0)
-    report = classification_report(y_test, y_pred, target_names=["ham", "spam"], output_dict=True, zero_division=0)
-    cm = confusion_matrix(y_test, y_pred)
+    with timer.stage("evaluate"):
+        y_pred = clf.predict(X_test_vec)
+        metrics, cm = evaluate(y_test, y_pred)
+
+    with timer.stage("plot_confusion"):
+        cm_path = out_dir / "confusion_matrix.png"
+        plot_confusion(cm, cm_path)
 
     # Save artifacts
-    metrics = {
-        "accuracy": acc,
-        "precision_weighted": precision,
-        "recall_weighted": recall,
-        "f1_weighted": f1,
-        "classification_report": report,
+    with timer.stage("save_artifacts"):
+        written = save_model_artifacts(clf, vectorizer, out_dir)
+        save_holdout(X_test, y_test, out_dir)
+        if near_dup is not None:
+            near_dup.save(out_dir / NEAR_DUP_NAME)
+            written.append(NEAR_DUP_NAME)
+
+    if args.cascade:
+        print("Training cascade prefilter...")
+        with timer.stage("cascade_fit", rows=len(X_train)):
+            prefilter = Prefilter.fit(list(X_train), y_train, args.cascade_features, args.cascade_band, args.seed)
+            prefilter.save(out_dir / CASCADE_NAME)
+            written.append(CASCADE_NAME)
+        with timer.stage("cascade_evaluate", rows=len(X_test)):
+            metrics["cascade"] = evaluate_cascade(prefilter, clf, vectorizer, X_test, y_test)
+
+    if args.dtype_report:
+        print("Comparing float64 and float32 pipelines...")
+        with timer.stage("dtype_report"):
+            metrics["dtype_report"] = compare_dtypes(train_counts, counts[idx_test], feature_names, X_test,
+                                                     y_train, y_test, args.seed, args.balanced)
+
+    if args.compact:
+        with timer.stage("export_compact"):
+            metrics["compact"] = export_compact(clf, vectorizer, X_test, y_test, out_dir,
+                                                args.compact, args.prune_threshold)
+            written.append(COMPACT_BUNDLE_NAME)
+    remove_stale_artifacts(out_dir, written)
+
+    metrics.update({
         "label_map": label_map,
         "seed": args.seed,
         "test_size": args.test_size,
-    }
-    metrics_path = out_dir / "metrics.json"
-    with open(metrics_path, "w", encoding="utf-8") as f:
-        json.dump(metrics, f, indent=2)
-
-    cm_path = out_dir / "confusion_matrix.png"
-    plot_confusion(cm, cm_path)
-
-    model_path = out_dir / "model.joblib"
-    vec_path = out_dir / "vectorizer.joblib"
-    joblib.dump(clf, model_path)
-    joblib.dump(vectorizer, vec_path)
+        "dtype": np.dtype(vectorizer.dtype).name,
+        "n_train_docs": int(len(X_train)),
+        "model_version": 1,
+    })
+    if near_dup is not None:
+        metrics["dedup"] = dedup_info
+    write_metrics(metrics, timer, out_dir)
+    timer.print_table()
 
     # Simple console summary
-    print("=== Results ===")
-    print(f"Accuracy: {acc:.4f}")
-    print(f"Weighted Precision: {precision:.4f} | Recall: {recall:.4f} | F1: {f1:.4f}")
-    print(f"Artifacts saved to: {out_dir.resolve()}")
+    print_summary(metrics)
+    if args.compact:
+        c = metrics["compact"]
+        print(f"=== Compact export ({c['quantize']}, |coef| >= {c['prune_threshold']}) ===")
+        print(f"Nonzero coefficients: {c['n_features_full']} -> {c['n_features']}")
+        for name in ("full", "compact"):
+            r = c[name]
+            print(f"{name:<8} size={r['bytes'] / 1024:8.1f} KB load={r['load_s'] * 1000:7.1f} ms "
+                  f"memory={r['memory_mb']:6.2f} MB accuracy={r['accuracy']:.4f}")
+        print(f"joblib pair size: {c['joblib_bytes'] / 1024:.1f} KB | accuracy delta: {c['accuracy_delta']:+.4f} "
+              f"| max margin delta: {c['max_margin_delta']:.4f}")
+    if args.dtype_report:
+        print_dtype_report(metrics["dtype_report"])
+    if args.cascade:
+        c = metrics["cascade"]
+        print(f"=== Cascade (band {c['band']}, {c['n_features']} buckets) ===")
+        print(f"Early exit: {c['early_exit_fraction']:.1%} of test messages | stage-1 accuracy {c['stage1_accuracy']:.4f}")
+        print(f"Throughput: {c['full_msgs_per_s']:,.0f} -> {c['cascade_msgs_per_s']:,.0f} msg/s "
+              f"({c['throughput_gain']:.2f}x)")
+        print(f"Accuracy: full {c['full_accuracy']:.4f} | cascade {c['cascade_accuracy']:.4f} "
+              f"({c['accuracy_delta']:+.4f}) | agreement {c['agreement']:.4f}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+import argparse
+import json
+import shutil
+import time
+from collections import Counter
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+
+from artifact_store import is_published, resolve_artifacts, staging_dir
+from instrumentation import StageTimer
+from preprocess import read_dataset
+from train import OPTIONAL_ARTIFACTS, ensure_out_dir, evaluate, remove_stale_artifacts, save_model_artifacts
+
+
+def load_delta(path: Path, label_map: dict) -> Tuple[np.ndarray, np.ndarray]:
+    df = read_dataset(path)
+    y = df["label"].astype(str).str.strip().str.lower().map(label_map)
+    known = y.notna().values
+    if not known.all():
+        print(f"Skipping {int((~known).sum())} rows with labels outside {label_map}")
+    return df["text"].to_numpy(dtype=object)[known], y.to_numpy()[known].astype(int)
+
+
+def delta_document_frequencies(vectorizer, texts) -> Counter:
+    analyzer = vectorizer.build_analyzer()
+    df = Counter()
+    for text in texts:
+        df.update(set(analyzer(text)))
+    return df
+
+
+def extend_vocabulary(vectorizer, texts, n_old_docs: Optional[int], max_new_terms: int) -> int:
+    """Add unseen terms from ``texts`` to a fitted TfidfVectorizer and refresh its IDF.
+
+    New terms get indices after the existing ones, so old feature columns (and
+    the classifier weights attached to them) keep their positions. Returns the
+    number of terms added.
+    """
+    delta_df = delta_document_frequencies(vectorizer, texts)
+    vocab = vectorizer.vocabulary_
+    min_df = vectorizer.min_df if isinstance(vectorizer.min_df, int) else 1
+    candidates = [(df, term) for term, df in delta_df.items() if term not in vocab and df >= min_df]
+    candidates.sort(key=lambda c: (-c[0], c[1]))
+    new_terms = [term for _, term in candidates[:max_new_terms]]
+
+    idf = np.asarray(vectorizer.idf_, dtype=np.float64)
+    if n_old_docs:
+        # Recover each term's document frequency from its IDF, add the delta counts
+        # and recompute, matching what a refit on old + new rows would produce.
+        smooth = int(vectorizer.smooth_idf)
+        n_docs = n_old_docs + len(texts)
+        old_df = np.rint((n_old_docs + smooth) / np.exp(idf - 1.0) - smooth)
+        for term, count in delta_df.items():
+            idx = vocab.get(term)
+            if idx is not None:
+                old_df[idx] += count
+        new_df = np.array([delta_df[t] for t in new_terms], dtype=np.float64)
+        df_all = np.concatenate([old_df, new_df])
+        idf = np.log((n_docs + smooth) / (df_all + smooth)) + 1.0
+    else:
+        # Without the original corpus size, keep the fitted IDF and weight new terms
+        # by their frequency in the delta alone.
+        print("metrics.json has no n_train_docs; existing IDF weights are left unchanged")
+        n = len(texts)
+        new_df = np.array([delta_df[t] for t in new_terms], dtype=np.float64)
+        idf = np.concatenate([idf, np.log((n + 1) / (new_df + 1)) + 1.0])
+
+    vocab = dict(vocab)
+    for term in new_terms:
+        vocab[term] = len(vocab)
+    vectorizer.vocabulary_ = vocab
+    # The fitted TfidfTransformer remembers its input width; dropping it lets the
+    # idf_ setter build a fresh one sized to the grown vocabulary.
+    del vectorizer._tfidf
+    vectorizer.idf_ = idf.astype(vectorizer.dtype)
+    return len(new_terms)
+
+
+def warm_start(clf, n_features: int, alpha: float, eta0: float, seed: int, dtype=np.float64) -> SGDClassifier:
+    # SGD updates the weights in the feature dtype, so they must start in it.
+    coef = np.zeros((1, n_features), dtype=dtype)
+    old_coef = np.asarray(clf.coef_, dtype=dtype).reshape(1, -1)
+    coef[:, :old_coef.shape[1]] = old_coef
+    # Keep the model's own loss: LinearSVC defaults to squared hinge, and SGD
+    # accepts the same name. A constant, small step size stops the first few
+    # updates from overwriting what the full training run learned.
+    sgd = SGDClassifier(loss=getattr(clf, "loss", "squared_hinge"), alpha=alpha, learning_rate="constant", eta0=eta0, random_state=seed)
+    sgd.coef_ = coef
+    sgd.intercept_ = np.asarray(clf.intercept_, dtype=dtype).reshape(1).copy()
+    return sgd
+
+
+def equivalent_alpha(clf, n_docs: Optional[int]) -> float:
+    # LinearSVC minimizes ||w||^2 / 2 + C * sum(loss) and SGD mean(loss) + alpha * ||w||^2 / 2,
+    # so with the same loss (see warm_start) alpha = 1 / (C * n).
+    if isinstance(clf, SGDClassifier):
+        return clf.alpha
+    if n_docs and getattr(clf, "C", None):
+        return 1.0 / (clf.C * n_docs)
+    return 1e-4
+
+
+def holdout_accuracy(clf, vectorizer, holdout) -> Optional[float]:
+    if holdout is None:
+        return None
+    metrics, _ = evaluate(holdout["y"], clf.predict(vectorizer.transform(holdout["texts"])))
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update a trained model with newly labeled rows")
+    parser.add_argument("--new", type=str, required=True, help="CSV with only the new labeled rows (label,text)")
+    parser.add_argument("--artifacts", type=str, default="artifacts", help="Directory with the current model")
+    parser.add_argument("--out", type=str, default=None,
+                        help="Where to write the updated model (default: --artifacts, which must then be "
+                             "a published root); published roots get a new version")
+    parser.add_argument("--epochs", type=int, default=5, help="Passes over the new rows")
+    parser.add_argument("--eta0", type=float, default=0.05, help="SGD step size")
+    parser.add_argument("--alpha", type=float, default=None,
+                        help="L2 regularization (default: matched to the current model's C and corpus size)")
+    parser.add_argument("--max-new-terms", type=int, default=5000,
+                        help="Cap on vocabulary terms added per update (TF-IDF models only)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    art_dir = resolve_artifacts(Path(args.artifacts))
+    out_root = Path(args.out) if args.out else Path(args.artifacts)
+    if not is_published(out_root) and out_root.resolve() == art_dir.resolve():
+        # Writing over an unversioned model would leave no copy to roll back to.
+        parser.error(f"{out_root} is not a published root; pass --out with a new directory "
+                     "or train it with --publish")
+    timer = StageTimer()
+
+    with timer.stage("load_model"):
+        clf = joblib.load(art_dir / "model.joblib")
+        vectorizer = joblib.load(art_dir / "vectorizer.joblib")
+        metrics_path = art_dir / "metrics.json"
+        metrics = json.loads(metrics_path.read_text(encoding="utf-8")) if metrics_path.exists() else {}
+        holdout_path = art_dir / "holdout.joblib"
+        holdout = joblib.load(holdout_path) if holdout_path.exists() else None
+    label_map = metrics.get("label_map", {"ham": 0, "spam": 1})
+    n_old_docs = metrics.get("n_train_docs")
+
+    with timer.stage("load_delta"):
+        texts, y = load_delta(Path(args.new), label_map)
+    if len(texts) == 0:
+        raise ValueError(f"No usable labeled rows in {args.new}")
+    print(f"New rows: {len(texts)} (spam={int(y.sum())}, ham={int(len(y) - y.sum())})")
+
+    with timer.stage("holdout_before"):
+        before = holdout_accuracy(clf, vectorizer, holdout)
+
+    n_new_terms = 0
+    with timer.stage("extend_vocabulary"):
+        # Hashing vectorizers already map unseen terms to fixed columns.
+        if hasattr(vectorizer, "vocabulary_"):
+            n_new_terms = extend_vocabulary(vectorizer, texts, n_old_docs, args.max_new_terms)
+            n_features = len(vectorizer.vocabulary_)
+        else:
+            n_features = vectorizer.n_features
+    print(f"Vocabulary terms added: {n_new_terms}")
+
+    alpha = args.alpha if args.alpha is not None else equivalent_alpha(clf, (n_old_docs or 0) + len(texts))
+    with timer.stage("partial_fit"):
+        model = warm_start(clf, n_features, alpha, args.eta0, args.seed, vectorizer.dtype)
+        X = vectorizer.transform(texts)
+        rng = np.random.default_rng(args.seed)
+        for _ in range(args.epochs):
+            order = rng.permutation(len(y))
+            model.partial_fit(X[order], y[order], classes=np.array([0, 1]))
+
+    with timer.stage("holdout_after"):
+        after = holdout_accuracy(model, vectorizer, holdout)
+
+    version = int(metrics.get("model_version", 1)) + 1
+    if after:
+        metrics.update(after)
+    metrics["model_version"] = version
+    metrics["n_train_docs"] = (n_old_docs or 0) + int(len(texts))
+
+    if is_published(out_root):
+        out_ctx = staging_dir(out_root)
+    else:
+        ensure_out_dir(out_root)
+        out_ctx = nullcontext(out_root)
+    with out_ctx as out_dir:
+        with timer.stage("save_artifacts"):
+            if out_dir != art_dir:
+                # Carry over what the update does not rewrite (hold-out, plots). Optional
+                # artifacts belong to the old weights: the compact bundle and cascade were
+                # fit to them, and the near-dup index would answer with labels voted
+                # before the new rows, overriding the updated model.
+                for path in art_dir.iterdir():
+                    if path.is_file() and path.name not in OPTIONAL_ARTIFACTS:
+                        shutil.copy2(path, out_dir / path.name)
+            remove_stale_artifacts(out_dir, save_model_artifacts(model, vectorizer, out_dir))
+
+        metrics.setdefault("updates", []).append({
+            "version": version,
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": str(args.new),
+            "rows": int(len(texts)),
+            "new_terms": n_new_terms,
+            "alpha": alpha,
+            "eta0": args.eta0,
+            "epochs": args.epochs,
+            "accuracy_before": before["accuracy"] if before else None,
+            "accuracy_after": after["accuracy"] if after else None,
+            "timings": timer.summary(),
+        })
+        with open(out_dir / "metrics.json", "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2)
+
+    timer.print_table()
+    print("=== Update ===")
+    if before and after:
+        print(f"Hold-out accuracy: {before['accuracy']:.4f} -> {after['accuracy']:.4f} "
+              f"({after['accuracy'] - before['accuracy']:+.4f})")
+    else:
+        print("No stored hold-out (holdout.joblib); accuracy not reported")
+    print(f"Model version {version} saved to: {resolve_artifacts(out_root).resolve()}")
+
+
+if __name__ == "__main__":
+    main()